@@ -0,0 +1,290 @@
+# audio_renderer.py
+# ---------------- Offline Audio Renderer ----------------
+# Turns the MIDI files SwarmMusicMapper writes into a WAV file without an
+# external synth. Notes and tempo changes are read once into arrays; the
+# audio is then synthesized one time block at a time with NumPy, so memory
+# stays flat however long the piece is, and blocks can be rendered on
+# several cores and written in order.
+#
+#   python audio_renderer.py outputs/swarm_music.mid -o outputs/swarm_music.wav
+
+import argparse
+import os
+import wave
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from mido import MidiFile
+
+from scales import BEND_RANGE
+
+
+# ---------------- INSTRUMENTS ----------------
+
+class Instrument:
+    """
+    Additive voice: a few harmonics (relative amplitudes), optionally doubled
+    with a slightly detuned copy, shaped by an ADSR envelope in seconds.
+    """
+    def __init__(self, harmonics, attack, decay, sustain, release, detune=0.0):
+        self.harmonics = np.asarray(harmonics, dtype=float)
+        self.attack = attack
+        self.decay = decay
+        self.sustain = sustain
+        self.release = release
+        self.detune = detune
+
+    def envelope(self, t, length):
+        """ADSR level at t seconds after note on, for notes length seconds long."""
+        held = np.minimum(t, length)
+        level = np.where(
+            held < self.attack,
+            held / self.attack,
+            self.sustain + (1.0 - self.sustain) * np.exp(-(held - self.attack) / self.decay)
+        )
+        released = np.clip(1.0 - (t - length) / self.release, 0.0, 1.0)
+        return np.where(t < 0, 0.0, level * released)
+
+    def oscillator(self, t, freq):
+        """Sum of harmonics at t seconds; t and freq broadcast together."""
+        phase = 2 * np.pi * freq * t
+        if self.detune:
+            return 0.5 * (self._harmonics(phase * (1 + self.detune))
+                          + self._harmonics(phase * (1 - self.detune)))
+        return self._harmonics(phase)
+
+    def _harmonics(self, phase):
+        # sin(h x) by the Chebyshev recurrence: one sin and one cos in all
+        two_cos = 2 * np.cos(phase)
+        previous, current = np.zeros_like(phase), np.sin(phase)
+        out = self.harmonics[0] * current
+        for amp in self.harmonics[1:]:
+            previous, current = current, two_cos * current - previous
+            out += amp * current
+        return out / self.harmonics.sum()
+
+
+INSTRUMENTS = {
+    # String Ensemble 1: slow bow attack, bright, chorused
+    48: Instrument([1.0, 0.5, 0.33, 0.25, 0.2], attack=0.08, decay=0.4, sustain=0.8,
+                   release=0.3, detune=0.003),
+    # Acoustic Bass: quick pluck that fades
+    32: Instrument([1.0, 0.6, 0.2], attack=0.005, decay=0.25, sustain=0.4, release=0.12),
+}
+DEFAULT_INSTRUMENT = Instrument([1.0], attack=0.01, decay=0.2, sustain=0.7, release=0.1)
+
+
+def instrument(program):
+    return INSTRUMENTS.get(program, DEFAULT_INSTRUMENT)
+
+
+# ---------------- MIDI ----------------
+
+def tempo_map(mid):
+    """
+    (ticks, seconds, tempos) arrays: every tempo change, from any track, at
+    its absolute tick, with the time in seconds at which it takes effect.
+    """
+    changes = [(0, 500000)]
+    for track in mid.tracks:
+        tick = 0
+        for msg in track:
+            tick += msg.time
+            if msg.type == 'set_tempo':
+                changes.append((tick, msg.tempo))
+    changes.sort(key=lambda change: change[0])  # stable: later events win ties
+
+    ticks = np.array([c[0] for c in changes], dtype=np.int64)
+    tempos = np.array([c[1] for c in changes], dtype=float)
+    spans = np.diff(ticks) * tempos[:-1] / (1_000_000 * mid.ticks_per_beat)
+    seconds = np.concatenate(([0.0], np.cumsum(spans)))
+    return ticks, seconds, tempos
+
+
+def ticks_to_seconds(ticks, tempo_ticks, tempo_seconds, tempos, ticks_per_beat):
+    ticks = np.asarray(ticks)
+    idx = np.searchsorted(tempo_ticks, ticks, side='right') - 1
+    return tempo_seconds[idx] + (ticks - tempo_ticks[idx]) * tempos[idx] / (1_000_000 * ticks_per_beat)
+
+
+def read_notes(path):
+    """
+    Reads a MIDI file into note arrays sorted by start: 'start' and 'end'
+    in seconds, 'pitch' (fractional when bent), 'velocity' and 'program'.
+    Note-offs close the oldest open note of their key; notes left open end
+    with their track. A note keeps the bend its channel had at note on.
+    """
+    mid = MidiFile(path)
+    rows = []
+    for track in mid.tracks:
+        tick = 0
+        programs = defaultdict(int)
+        bends = defaultdict(int)
+        sounding = defaultdict(deque)
+        for msg in track:
+            tick += msg.time
+            if msg.type == 'program_change':
+                programs[msg.channel] = msg.program
+            elif msg.type == 'pitchwheel':
+                bends[msg.channel] = msg.pitch
+            elif msg.type == 'note_on' and msg.velocity > 0:
+                sounding[msg.channel, msg.note].append(
+                    (tick, msg.velocity, programs[msg.channel], bends[msg.channel]))
+            elif msg.type in ('note_on', 'note_off'):
+                if sounding[msg.channel, msg.note]:
+                    start, velocity, program, bend = sounding[msg.channel, msg.note].popleft()
+                    rows.append((start, tick, msg.note, velocity, program, bend))
+        for (_, note), opened in sounding.items():
+            rows.extend((start, tick, note, velocity, program, bend)
+                        for start, velocity, program, bend in opened)
+
+    table = np.array(rows, dtype=np.int64).reshape(-1, 6)
+    table = table[np.argsort(table[:, 0], kind='stable')]
+    tempo = tempo_map(mid)
+    return {
+        "start": ticks_to_seconds(table[:, 0], *tempo, mid.ticks_per_beat),
+        "end": ticks_to_seconds(table[:, 1], *tempo, mid.ticks_per_beat),
+        "pitch": table[:, 2] + table[:, 5] * BEND_RANGE / 8192,
+        "velocity": table[:, 3],
+        "program": table[:, 4],
+    }
+
+
+# ---------------- SYNTHESIS ----------------
+
+def add_tails(notes):
+    """
+    Adds 'tail', when each note has fully faded (release included), and
+    'reach', the running max of the tails in start order.
+    """
+    release = np.array([instrument(p).release for p in notes["program"].tolist()])
+    notes["tail"] = notes["end"] + release
+    notes["reach"] = np.maximum.accumulate(notes["tail"]) if len(release) else release
+    return notes
+
+
+def render_block(notes, first, count, sample_rate, gain=0.3, max_samples=1 << 20):
+    """
+    Synthesizes samples [first, first + count) as floats. Notes are found by
+    start time and a running max of their tails. Each instrument's notes are
+    laid out back to back, every note over just the samples it sounds in,
+    synthesized in one flat array and summed into the block.
+    """
+    out = np.zeros(count)
+    t0 = first / sample_rate
+    t1 = (first + count) / sample_rate
+
+    hi = np.searchsorted(notes["start"], t1, side='left')
+    lo = np.searchsorted(notes["reach"][:hi], t0, side='right')
+    active = np.arange(lo, hi)
+    active = active[notes["tail"][active] > t0]
+    if not len(active):
+        return out
+
+    # sample range of every note inside the block
+    begin = np.maximum(first, (notes["start"][active] * sample_rate).astype(np.int64))
+    end = np.minimum(first + count, np.ceil(notes["tail"][active] * sample_rate).astype(np.int64))
+    keep = end > begin
+    active, begin, end = active[keep], begin[keep], end[keep]
+
+    programs = notes["program"][active]
+    for program in np.unique(programs).tolist():
+        voice = instrument(program)
+        mine = programs == program
+        idx, lo_s, spans = active[mine], begin[mine] - first, (end - begin)[mine]
+
+        # batches of whole notes of at most max_samples samples in total
+        batch = np.cumsum(spans) // max_samples
+        for b in np.unique(batch).tolist():
+            sel = batch == b
+            n_idx, n_lo, n_span = idx[sel], lo_s[sel], spans[sel]
+            total = int(n_span.sum())
+            within = np.arange(total) - np.repeat(np.cumsum(n_span) - n_span, n_span)
+            offset = np.repeat(n_lo, n_span) + within
+
+            start = np.repeat(notes["start"][n_idx], n_span)
+            length = np.repeat(notes["end"][n_idx] - notes["start"][n_idx], n_span)
+            freq = np.repeat(440.0 * 2.0 ** ((notes["pitch"][n_idx] - 69) / 12.0), n_span)
+            amp = np.repeat(notes["velocity"][n_idx] / 127.0, n_span)
+
+            t = (offset + first) / sample_rate - start
+            wave_ = voice.oscillator(t, freq) * voice.envelope(t, length) * amp
+            out += np.bincount(offset, weights=wave_, minlength=count)
+    return out * gain
+
+
+def to_pcm(samples):
+    """Soft-clipped 16-bit little-endian PCM bytes."""
+    return (np.tanh(samples) * 32767).astype('<i2').tobytes()
+
+
+# ---------------- PARALLEL ----------------
+
+_worker_notes = None
+
+
+def _init_worker(notes):
+    global _worker_notes
+    _worker_notes = notes
+
+
+def _render_job(job):
+    first, count, sample_rate, gain = job
+    return to_pcm(render_block(_worker_notes, first, count, sample_rate, gain))
+
+
+def render_wav(midi_path, wav_path, sample_rate=44100, block_seconds=2.0,
+               workers=1, gain=0.3):
+    """
+    Renders a MIDI file to a mono 16-bit WAV, block by block. With more
+    than one worker the blocks are rendered in a process pool, at most a
+    few per worker in flight, and written in order. Returns the seconds
+    of audio written.
+    """
+    notes = add_tails(read_notes(midi_path))
+    total = int(np.ceil((notes["tail"].max() if len(notes["tail"]) else 0.0) * sample_rate))
+    block = max(1, int(block_seconds * sample_rate))
+    jobs = [(first, min(block, total - first), sample_rate, gain)
+            for first in range(0, total, block)]
+
+    with wave.open(str(wav_path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+
+        if workers <= 1:
+            for first, count, _, _ in jobs:
+                wav.writeframes(to_pcm(render_block(notes, first, count, sample_rate, gain)))
+        else:
+            window = workers * 2
+            with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(notes,)) as pool:
+                pending = deque()
+                for job in jobs:
+                    pending.append(pool.submit(_render_job, job))
+                    if len(pending) >= window:
+                        wav.writeframes(pending.popleft().result())
+                while pending:
+                    wav.writeframes(pending.popleft().result())
+
+    return total / sample_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a swarm MIDI file to WAV.")
+    parser.add_argument("midi", nargs="?", default=Path(__file__).parent / "outputs" / "swarm_music.mid")
+    parser.add_argument("-o", "--output", help="WAV path (default: next to the MIDI file)")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--block-seconds", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    output = args.output or Path(args.midi).with_suffix(".wav")
+    seconds = render_wav(args.midi, output, args.sample_rate, args.block_seconds, args.workers)
+    print(f"🔊 {output} rendered ({seconds:.1f}s of audio)")
+
+
+if __name__ == "__main__":
+    main()
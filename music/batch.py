@@ -0,0 +1,123 @@
+# batch.py
+# ---------------- Batch Runner ----------------
+# Renders the same swarm configuration across many seeds in a process
+# pool. Every seed gets its own output directory; a manifest.json lists
+# the results.
+#
+#   python batch.py --seeds 0-99 --frames 2000 --workers 8 --output-dir batch
+#   python batch.py --seeds 1,5,9 --config my_swarm.json
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, replace
+from pathlib import Path
+
+from engine import SwarmConfig, default_config
+from headless import render
+
+
+def parse_seeds(text):
+    """'0-9' -> [0..9], '1,5,9' -> [1, 5, 9], and mixes of both."""
+    seeds = []
+    for part in text.split(","):
+        if "-" in part:
+            lo, hi = part.split("-")
+            seeds.extend(range(int(lo), int(hi) + 1))
+        else:
+            seeds.append(int(part))
+    return seeds
+
+
+def run_job(job):
+    """Worker entry point: one headless render, configured only by the job."""
+    config = SwarmConfig(**job["config"])
+    output_dir = Path(job["output_dir"])
+    trajectory = output_dir / "swarm.traj" if job["trajectory"] else None
+    return render(config, job["frames"], job["seed"], output_dir,
+                  backend=job["backend"], trajectory=trajectory)
+
+
+def run_batch(config, seeds, num_frames, output_dir, workers=None,
+              backend="agents", trajectory=True):
+    """
+    Fans the seeds out over a process pool and writes manifest.json.
+    Returns the manifest dict.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    jobs = [
+        {
+            "seed": seed,
+            "frames": num_frames,
+            "backend": backend,
+            "trajectory": trajectory,
+            "config": asdict(config),
+            "output_dir": str(output_dir / f"seed_{seed:05d}"),
+        }
+        for seed in seeds
+    ]
+
+    start = time.perf_counter()
+    results, failures = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as exc:
+                failures.append({"seed": job["seed"], "error": repr(exc)})
+                print(f"seed {job['seed']}: failed ({exc!r})")
+                continue
+            results.append(result)
+            print(f"seed {result['seed']}: {result['total_seconds']:.2f}s "
+                  f"({result['frames_per_sec'] or 0:.1f} frames/sec)")
+
+    manifest = {
+        "config": asdict(config),
+        "frames": num_frames,
+        "backend": backend,
+        "wall_seconds": time.perf_counter() - start,
+        "results": sorted(results, key=lambda r: r["seed"]),
+        "failures": sorted(failures, key=lambda r: r["seed"]),
+    }
+    with open(output_dir / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render many seeds in parallel.")
+    parser.add_argument("--seeds", default="0-7", help="e.g. 0-99 or 1,5,9")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--agents", type=int, default=None)
+    parser.add_argument("--config", help="JSON file with SwarmConfig fields")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--engine", choices=("agents", "arrays"), default="agents")
+    parser.add_argument("--no-trajectory", action="store_true")
+    parser.add_argument("--output-dir", default=Path(__file__).parent / "outputs" / "batch")
+    args = parser.parse_args()
+
+    config = default_config()
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = replace(config, **json.load(f))
+    if args.agents is not None:
+        config = replace(config, num_agents=args.agents)
+
+    manifest = run_batch(
+        config, parse_seeds(args.seeds), args.frames, args.output_dir,
+        workers=args.workers, backend=args.engine,
+        trajectory=not args.no_trajectory
+    )
+    print(f"{len(manifest['results'])} seeds rendered in {manifest['wall_seconds']:.2f}s, "
+          f"{len(manifest['failures'])} failed")
+    print(f"📋 {Path(args.output_dir) / 'manifest.json'} written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# benchmark.py
+# ---------------- Music Mapping Benchmark ----------------
+# Times SwarmMusicMapper on fixed synthetic trajectories and hashes the
+# MIDI it writes, so a change can be checked for both speed and output.
+#
+#   python benchmark.py                              # run and print
+#   python benchmark.py --save-baseline bench.json   # remember this run
+#   python benchmark.py --check bench.json           # compare against it
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from engine import WIDTH, HEIGHT, MAX_SPEED
+from data_layer import FrameView
+from midi_writer import MidiWriter, MidoWriter, StreamingMidiWriter
+from music_mapper import SwarmMusicMapper
+from cluster_mapper import ClusterMusicMapper
+from scales import SCALES
+
+DEFAULT_SIZES = "60x600,500x600,2000x200"
+
+WRITERS = {
+    "mido": lambda path: MidoWriter(),
+    "direct": lambda path: MidiWriter(),
+    "streaming": lambda path: StreamingMidiWriter(path),
+}
+MAPPERS = {"swarm": SwarmMusicMapper, "clusters": ClusterMusicMapper}
+
+
+def parse_sizes(text):
+    """'60x600,500x600' -> [(60, 600), (500, 600)] as (agents, frames)."""
+    sizes = []
+    for part in text.split(","):
+        agents, frames = part.lower().split("x")
+        sizes.append((int(agents), int(frames)))
+    return sizes
+
+
+def synthetic_trajectory(num_agents, num_frames, seed=0):
+    """
+    A deterministic (frames, agents, 4) float32 trajectory: agents wander
+    with smoothly turning velocities capped at MAX_SPEED, wrapping at the
+    edges like the simulation. The same arguments give the same bytes.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform((0, 0), (WIDTH, HEIGHT), (num_agents, 2))
+    vel = rng.uniform(-MAX_SPEED, MAX_SPEED, (num_agents, 2))
+    turns = rng.normal(0.0, 0.3, (num_frames, num_agents, 2))
+
+    out = np.empty((num_frames, num_agents, 4), dtype=np.float32)
+    for f in range(num_frames):
+        vel += turns[f]
+        speed = np.sqrt((vel * vel).sum(axis=1, keepdims=True))
+        vel *= np.minimum(1.0, MAX_SPEED / np.maximum(speed, 1e-12))
+        pos = (pos + vel) % (WIDTH, HEIGHT)
+        out[f, :, :2] = pos
+        out[f, :, 2:] = vel
+    return out
+
+
+def run_mapper(trajectory, mapper, writer, path, per_frame, scale="major"):
+    """Maps a trajectory and saves it; returns (map seconds, save seconds)."""
+    music = MAPPERS[mapper](WRITERS[writer](path), scale=scale)
+    start = time.perf_counter()
+    if per_frame:
+        for frame in trajectory:
+            music.add_frame(FrameView(frame))
+    else:
+        music.add_frames(trajectory)
+    mapped = time.perf_counter()
+    music.save(path)
+    return mapped - start, time.perf_counter() - mapped
+
+
+def digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def bench_case(num_agents, num_frames, mapper="swarm", writer="direct", repeat=3, seed=0,
+               scale="major"):
+    """
+    Benchmarks one trajectory size. Speeds are the best of repeat runs;
+    peak memory is measured in a separate traced run of add_frames.
+    """
+    trajectory = synthetic_trajectory(num_agents, num_frames, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.mid")
+
+        frame_times, block_times, save_times = [], [], []
+        for _ in range(repeat):
+            mapped, saved = run_mapper(trajectory, mapper, writer, path, True, scale)
+            frame_times.append(mapped)
+            save_times.append(saved)
+        frame_hash = digest(path)
+        for _ in range(repeat):
+            mapped, saved = run_mapper(trajectory, mapper, writer, path, False, scale)
+            block_times.append(mapped)
+            save_times.append(saved)
+        block_hash = digest(path)
+
+        tracemalloc.start()
+        run_mapper(trajectory, mapper, writer, path, False, scale)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = os.path.getsize(path)
+
+    return {
+        "agents": num_agents,
+        "frames": num_frames,
+        "mapper": mapper,
+        "writer": writer,
+        "scale": scale,
+        "add_frame_fps": num_frames / min(frame_times),
+        "add_frames_fps": num_frames / min(block_times),
+        "save_seconds": min(save_times),
+        "peak_bytes": peak,
+        "midi_bytes": size,
+        "sha256": block_hash,
+        # add_frame and add_frames must write the same file
+        "consistent": frame_hash == block_hash,
+    }
+
+
+def case_key(result):
+    return (f"{result['agents']}x{result['frames']}/{result['mapper']}/{result['writer']}"
+            f"/{result.get('scale', 'major')}")
+
+
+def compare(results, baseline, max_slowdown):
+    """
+    Lines describing every result against the baseline, and whether all
+    hashes match and no speed fell below baseline / max_slowdown.
+    """
+    known = {case_key(r): r for r in baseline["results"]}
+    lines, ok = [], True
+    for result in results:
+        key = case_key(result)
+        old = known.get(key)
+        if old is None:
+            lines.append(f"{key}: no baseline")
+            continue
+        ratio = result["add_frames_fps"] / old["add_frames_fps"]
+        same = result["sha256"] == old["sha256"]
+        slow = ratio < 1 / max_slowdown
+        ok = ok and same and not slow
+        lines.append(
+            f"{key}: output {'unchanged' if same else 'CHANGED'}, "
+            f"speed x{ratio:.2f}{' SLOWER' if slow else ''}"
+        )
+    return lines, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the music mappers.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="agents x frames, comma separated")
+    parser.add_argument("--mapper", choices=sorted(MAPPERS), default="swarm")
+    parser.add_argument("--writer", choices=sorted(WRITERS), default="direct")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="major")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--check", help="compare against a baseline JSON file")
+    parser.add_argument("--max-slowdown", type=float, default=1.5,
+                        help="with --check, fail when this many times slower")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'size':>12} {'add_frame/s':>12} {'add_frames/s':>13} {'save ms':>8} "
+          f"{'peak MiB':>9}  sha256")
+    for num_agents, num_frames in parse_sizes(args.sizes):
+        result = bench_case(num_agents, num_frames, args.mapper, args.writer,
+                            args.repeat, args.seed, args.scale)
+        results.append(result)
+        print(f"{num_agents:>5}x{num_frames:<6} {result['add_frame_fps']:>12.1f} "
+              f"{result['add_frames_fps']:>13.1f} {result['save_seconds'] * 1000:>8.2f} "
+              f"{result['peak_bytes'] / 2**20:>9.2f}  {result['sha256'][:16]}"
+              f"{'' if result['consistent'] else '  add_frame != add_frames!'}")
+
+    ok = all(r["consistent"] for r in results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"seed": args.seed, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        lines, same = compare(results, baseline, args.max_slowdown)
+        print("\n".join(lines))
+        ok = ok and same
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# chunked_render.py
+# ---------------- Chunked Parallel Render ----------------
+# Maps a fully stored trajectory to MIDI on several cores. The frames are
+# split into chunks and rendered in two passes:
+#
+#   A (workers)  per chunk: tempos, note durations and frame lengths, and
+#                the chunk's melody smoothing composed into one table
+#   handoff      the main process walks the chunks to find the state each
+#                one starts from: last pitch, frame count, tick cursors, tempo
+#   B (workers)  per chunk: a mapper restored to that state writes its
+#                events into its own track buffers
+#
+# The track buffers are then joined into one file, byte for byte the same
+# as mapping every frame in order. Workers read their own chunk of a
+# trajectory file from its memory map, so the parent only ever holds the
+# pass A summaries.
+#
+#   python chunked_render.py run.traj -o outputs/swarm_music.mid --workers 4
+
+import argparse
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from data_layer import TrajectoryReader
+from engine import WIDTH
+from midi_writer import END_OF_TRACK, MidiWriter, midi_chunk
+from music_mapper import MELODY_VOICES, SwarmMusicMapper, compose_smoothing, frame_array
+
+
+def frame_block(source, start, stop, dtype=float):
+    """
+    Frames [start, stop) of a stored trajectory as a (frames, agents, 4)
+    array: an array, a buffer or TrajectoryReader with block(), a
+    FrameSequence such as swarm_buffer.frames, or a list of frames.
+    dtype=None keeps the frames as stored.
+    """
+    if hasattr(source, "block"):
+        return np.asarray(source.block(start, stop), dtype=dtype)
+    if hasattr(getattr(source, "buffer", None), "block"):
+        return np.asarray(source.buffer.block(start, stop), dtype=dtype)
+    if isinstance(source, np.ndarray):
+        return np.asarray(source[start:stop], dtype=dtype)
+    return np.array([frame_array(source[f]) for f in range(start, stop)], dtype=dtype)
+
+
+def frame_total(source):
+    if hasattr(source, "total_frames"):
+        return source.total_frames()
+    return len(source)
+
+
+_readers = {}  # trajectory files this process has mapped, by path
+
+
+def chunk_of(source, start, stop):
+    """
+    What a worker needs to read frames [start, stop): a trajectory file's
+    (path, start, stop), or for a source in memory the frames as stored.
+    """
+    if isinstance(source, TrajectoryReader):
+        return str(source.path), start, stop
+    return frame_block(source, start, stop, dtype=None), 0, stop - start
+
+
+def read_chunk(chunk):
+    """The frames of a chunk_of() as a float array, in the worker."""
+    source, start, stop = chunk
+    if isinstance(source, str):
+        if source not in _readers:
+            _readers[source] = TrajectoryReader(source)
+        source = _readers[source]
+    return frame_block(source, start, stop)
+
+
+# ---------------- PASS A ----------------
+
+def analyse_chunk(job):
+    """
+    Pass A for one chunk: per-frame tempo, duration and frame length, and
+    the composed smoothing table of all its agents in order. With
+    skip_first the first agent is left out of the table (the very first
+    note takes its target directly) and its scale index returned instead.
+    """
+    chunk, scale, width, skip_first = job
+    block = read_chunk(chunk)
+    mapper = SwarmMusicMapper(MidiWriter(), scale, width)
+    features = mapper.frame_features(block)
+    indices = features["scale_idx"].ravel()
+
+    first = None
+    if skip_first and len(indices):
+        first, indices = int(indices[0]), indices[1:]
+
+    voices = min(MELODY_VOICES, block.shape[1])
+    durations = [int(100 + e * 30) for e in features["energy"]]
+    return {
+        "tempos": [mapper.energy_to_tempo(e) for e in features["energy"]],
+        "durations": durations,
+        "lengths": [mapper.frame_length(range(voices), d) for d in durations],
+        "smoothing": compose_smoothing(indices, mapper.pitch_table),
+        "first_index": first,
+    }
+
+
+# ---------------- HANDOFF ----------------
+
+def chunk_states(initial, analyses, scale, width):
+    """
+    The mapper state at the start of every chunk, worked out from pass A
+    the same way _emit_frames moves the cursors: tempo changes only ever
+    move the conductor forward, melody ends where its frame ends, and the
+    bass cursor is the latest bass note-off so far.
+    """
+    mapper = SwarmMusicMapper(MidiWriter(), scale, width)
+    lo = mapper.pitch_floor
+
+    tempos = np.concatenate([a["tempos"] for a in analyses]).astype(np.int64)
+    durations = np.concatenate([a["durations"] for a in analyses]).astype(np.int64)
+    lengths = np.concatenate([a["lengths"] for a in analyses]).astype(np.int64)
+    starts = initial["frame_tick"] + np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    ends = starts + lengths
+    frames = np.arange(len(tempos))
+
+    previous = np.concatenate(([initial["current_tempo"]], tempos[:-1]))
+    changed = np.where(tempos != previous, starts, -1)
+    conductor = np.maximum(initial["ticks"]["conductor"], np.maximum.accumulate(changed))
+    melody = np.maximum(initial["ticks"]["melody"],
+                        np.maximum.accumulate(np.where(lengths > 0, ends, -1)))
+    bass_frame = (initial["frame_count"] + frames + 1) % 8 == 0
+    bass = np.maximum(initial["ticks"]["bass"],
+                      np.maximum.accumulate(np.where(bass_frame, starts + durations * 4, -1)))
+
+    states = []
+    last_pitch = initial["last_pitch"]
+    offset = 0
+    for analysis in analyses:
+        if offset == 0:
+            states.append(dict(initial))
+        else:
+            b = offset - 1
+            states.append({
+                "last_pitch": last_pitch,
+                "frame_count": initial["frame_count"] + offset,
+                "frame_tick": int(ends[b]),
+                "ticks": {"conductor": int(conductor[b]), "melody": int(melody[b]),
+                          "bass": int(bass[b])},
+                "current_tempo": int(tempos[b]),
+            })
+
+        if analysis["first_index"] is not None:
+            last_pitch = mapper.scale.pitches[analysis["first_index"]]
+        if last_pitch is not None:
+            last_pitch = int(analysis["smoothing"][last_pitch - lo]) + lo
+        offset += len(analysis["tempos"])
+    return states
+
+
+# ---------------- PASS B ----------------
+
+def render_chunk(job):
+    """
+    Pass B for one chunk: maps it from its start state and returns every
+    track's bytes and final running status. Only the first chunk keeps
+    the set-up events the mapper writes when it is created.
+    """
+    chunk, state, scale, width, first = job
+    block = read_chunk(chunk)
+    writer = MidiWriter()
+    mapper = SwarmMusicMapper(writer, scale, width)
+    if not first:
+        for track in writer.tracks:
+            track.data = bytearray()
+            track.running_status = None
+    mapper.set_state(state)
+    mapper.add_frames(block)
+    return [(bytes(t.data), t.running_status) for t in writer.tracks]
+
+
+def join_track(parts):
+    """
+    Joins one track's chunk bytes. A chunk starts without running status,
+    so its first status byte is dropped when the bytes before it already
+    left that status running.
+    """
+    data = bytearray()
+    running = None
+    for part, final in parts:
+        if not part:
+            continue
+        part = bytearray(part)
+        pos = 0
+        while part[pos] & 0x80:  # delta time
+            pos += 1
+        pos += 1
+        if running is not None and part[pos] == running:
+            del part[pos]
+        data += part
+        running = final
+    return data
+
+
+# ---------------- RENDER ----------------
+
+def render_chunked(source, filename, chunk_frames=None, workers=None,
+                   scale="major", width=WIDTH):
+    """
+    Renders a stored trajectory to filename with SwarmMusicMapper, chunk
+    by chunk across worker processes. Returns the number of chunks.
+    """
+    total = frame_total(source)
+    if not total:
+        # nothing to split: the file holds only the mapper's set-up
+        SwarmMusicMapper(MidiWriter(), scale, width).save(filename)
+        return 0
+    workers = workers or os.cpu_count() or 1
+    if chunk_frames is None:
+        chunk_frames = max(64, -(-total // (workers * 4)))
+    bounds = [(start, min(start + chunk_frames, total)) for start in range(0, total, chunk_frames)]
+
+    initial = SwarmMusicMapper(MidiWriter(), scale, width).get_state()
+    analyse_jobs = (
+        (chunk_of(source, start, stop), scale, width, k == 0 and initial["last_pitch"] is None)
+        for k, (start, stop) in enumerate(bounds)
+    )
+
+    def render_jobs(states):
+        return (
+            (chunk_of(source, start, stop), state, scale, width, k == 0)
+            for k, ((start, stop), state) in enumerate(zip(bounds, states))
+        )
+
+    if workers > 1 and len(bounds) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            analyses = list(pool.map(analyse_chunk, analyse_jobs))
+            states = chunk_states(initial, analyses, scale, width)
+            chunks = list(pool.map(render_chunk, render_jobs(states)))
+    else:
+        analyses = [analyse_chunk(job) for job in analyse_jobs]
+        states = chunk_states(initial, analyses, scale, width)
+        chunks = [render_chunk(job) for job in render_jobs(states)]
+
+    tracks = [join_track(parts) for parts in zip(*chunks)]
+    writer = MidiWriter()
+    header = struct.pack('>hhh', writer.midi_type, len(tracks), writer.ticks_per_beat)
+    with open(filename, 'wb') as f:
+        f.write(midi_chunk(b'MThd', header))
+        for data in tracks:
+            f.write(midi_chunk(b'MTrk', data + END_OF_TRACK))
+    return len(bounds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a stored trajectory to MIDI on several cores.")
+    parser.add_argument("trajectory")
+    parser.add_argument("-o", "--output", default=Path(__file__).parent / "outputs" / "swarm_music.mid")
+    parser.add_argument("--chunk-frames", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--scale", default="major")
+    parser.add_argument("--width", type=float, default=WIDTH, help="world width of the recorded run")
+    args = parser.parse_args()
+
+    trajectory = TrajectoryReader(args.trajectory)
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    chunks = render_chunked(trajectory, args.output, args.chunk_frames, args.workers, args.scale,
+                            args.width)
+    print(f"🎼 {args.output} rendered from {trajectory.total_frames()} frames in {chunks} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# cluster_mapper.py
+# ---------------- Cluster Music Mapper ----------------
+# A polyphonic mapping mode: every frame the swarm is split into clusters
+# (connected groups of agents within NEIGHBOR_RADIUS), and every cluster
+# plays its own voice on its own MIDI channel. A ClusterTracker keeps a
+# cluster's id, and so its channel and pitch, from frame to frame.
+
+import numpy as np
+
+from engine import (
+    NEIGHBOR_RADIUS, WIDTH, HEIGHT, ClusterTracker, cluster_groups, cluster_labels
+)
+from music_mapper import SwarmMusicMapper
+
+# 0-2 are the conductor, melody and bass tracks' own channels when
+# played live, 9 is drums
+VOICE_CHANNELS = [c for c in range(3, 16) if c != 9]
+VOICE_PROGRAM = 48  # String Ensemble 1, like the melody
+
+
+class ClusterMusicMapper(SwarmMusicMapper):
+    """
+    SwarmMusicMapper with one voice per cluster instead of the loudest
+    agents. A voice's pitch follows its cluster's centre, smoothed per
+    cluster; its volume follows the cluster's mean speed. Voices sound
+    together as a chord each frame. The largest clusters get a voice when
+    there are more clusters than channels. Tempo and bass are unchanged.
+    """
+    def __init__(self, writer=None, scale="major", radius=NEIGHBOR_RADIUS, min_size=2,
+                 width=WIDTH, height=HEIGHT):
+        super().__init__(writer, scale, width)
+        self.radius = radius
+        self.min_size = min_size
+        self.height = height
+        self.tracker = ClusterTracker()
+        self.voices = {}  # cluster id -> [channel, last pitch]
+        self.free_channels = list(VOICE_CHANNELS)
+        self.programmed = set()
+
+    # ---------------- CLUSTERS ----------------
+
+    def frame_clusters(self, frame_pos, frame_number):
+        """Member arrays and tracked ids of one frame's clusters."""
+        labels = cluster_labels(frame_pos, self.radius, self.width, self.height)
+        groups = cluster_groups(labels, self.min_size)
+        return groups, self.tracker.update(groups, frame_number)
+
+    def cluster_voices(self, groups, ids, block_frame):
+        """
+        (channel, pitch, volume) for every voiced cluster of a frame,
+        assigning channels to new clusters and freeing those of gone ones.
+        """
+        live = set(ids)
+        for cluster in [c for c in self.voices if c not in live]:
+            self.free_channels.append(self.voices.pop(cluster)[0])
+        self.free_channels.sort()
+
+        # largest clusters first; ids break ties so the choice is stable
+        order = sorted(range(len(groups)), key=lambda g: (-len(groups[g]), ids[g]))
+        voiced = [g for g in order if ids[g] in self.voices]
+        for g in order:
+            if ids[g] not in self.voices and self.free_channels:
+                self.voices[ids[g]] = [self.free_channels.pop(0), None]
+                voiced.append(g)
+        if not voiced:
+            return []
+
+        x = block_frame[:, 0]
+        speed = np.sqrt(block_frame[:, 2] * block_frame[:, 2] + block_frame[:, 3] * block_frame[:, 3])
+        centre = np.array([x[groups[g]].mean() for g in voiced])
+        volume = np.array([speed[groups[g]].mean() for g in voiced])
+        target = self.quantizer.indices(centre)
+        volume = np.minimum(127, volume * 40).astype(np.int64)
+
+        # per-cluster smoothing: one table lookup per voice
+        last = np.array([self.voices[ids[g]][1] or 0 for g in voiced])
+        smoothed = self.pitch_table[target, np.maximum(last - self.pitch_floor, 0)] + self.pitch_floor
+        fresh = np.array([self.voices[ids[g]][1] is None for g in voiced])
+        pitch = np.where(fresh, self.quantizer.table[target], smoothed)
+
+        notes = []
+        for g, p, v in zip(voiced, pitch.tolist(), volume.tolist()):
+            voice = self.voices[ids[g]]
+            voice[1] = p
+            notes.append((voice[0], p, v))
+        return sorted(notes)
+
+    # ---------------- FRAME ----------------
+
+    def add_frames(self, block, timestamps=None):
+        block = np.asarray(block, dtype=float)
+        features = self.frame_features(block)
+
+        melodies = []
+        for f in range(len(block)):
+            groups, ids = self.frame_clusters(block[f, :, :2], self.frame_count + f + 1)
+            melodies.append(self.cluster_voices(groups, ids, block[f]))
+        self._emit_frames(features["energy"], features["avg_x"], melodies, timestamps)
+
+    def frame_length(self, melody, duration):
+        # one chord per frame, or a rest as long when no cluster plays
+        return duration
+
+    def _emit_melody(self, melody, duration, start):
+        for channel, _, _ in melody:
+            if channel not in self.programmed:
+                self.melody.program_change(VOICE_PROGRAM, time=0, channel=channel)
+                self.programmed.add(channel)
+
+        # a chord: all voices start together and stop together
+        notes = [(channel, *self.scale.to_midi(pitch), volume) for channel, pitch, volume in melody]
+        for channel, note, bend, volume in notes:
+            if self.scale.microtonal:
+                self.melody.pitchwheel(bend, time=self._at("melody", start), channel=channel)
+            self.melody.note_on(note, volume, time=self._at("melody", start), channel=channel)
+        for channel, note, _, _ in notes:
+            self.melody.note_off(note, 64, time=self._at("melody", start + duration), channel=channel)
@@ -0,0 +1,171 @@
+# headless.py
+# ---------------- Headless Runner ----------------
+# Runs the swarm without a display, as fast as the CPU allows,
+# and streams every frame into the music mapper.
+#
+#   python headless.py --agents 500 --frames 2000 --seed 7 --output-dir outputs
+
+import argparse
+import random
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from engine import (
+    Agent, SpatialHash, SwarmArrays, default_config,
+    step_agents, collision_pairs, positions
+)
+from data_layer import (
+    FrameEvents, FramePipeline, TrajectoryReader, TrajectoryWriter, agent_state_array
+)
+from midi_writer import StreamingMidiWriter
+from music_mapper import SwarmMusicMapper
+from cluster_mapper import ClusterMusicMapper
+from scales import SCALES
+
+MAPPERS = {"swarm": SwarmMusicMapper, "clusters": ClusterMusicMapper}
+
+
+def collision_events(frame_number, pos, config):
+    """Every colliding pair of one frame, as one (M, 2) array."""
+    pairs = collision_pairs(pos, config.collision_distance, config.width, config.height)
+    return FrameEvents(frame_number, {"collision": pairs})
+
+
+def simulate(pipeline, config, num_frames=600, seed=None,
+             backend="agents", collisions=True):
+    """
+    Steps the swarm num_frames times without drawing or frame capping and
+    publishes every frame, with its collision events, to the pipeline.
+    Returns (seconds stepping the swarm, seconds finding events and
+    publishing), so mapping and output do not count as simulation.
+    """
+    random.seed(seed)
+
+    if backend == "arrays":
+        swarm = SwarmArrays(config.num_agents, seed, config)
+        agents = swarm.agents
+    else:
+        swarm = None
+        agents = [Agent(config) for _ in range(config.num_agents)]
+        grid = SpatialHash.from_config(config)
+
+    stepping = publishing = 0.0
+    for frame_count in range(1, num_frames + 1):
+        start = time.perf_counter()
+        if swarm is not None:
+            swarm.step()
+        else:
+            grid.rebuild(agents)
+            step_agents(agents, grid)
+        stepped = time.perf_counter()
+        stepping += stepped - start
+
+        events = collision_events(frame_count, positions(agents), config) if collisions else ()
+        pipeline.publish(frame_count, agent_state_array(agents), events)
+        publishing += time.perf_counter() - stepped
+
+    return stepping, publishing
+
+
+def replay(pipeline, trajectory, config=None, collisions=True):
+    """Publishes the frames of a stored run, rebuilding collision events."""
+    config = config or default_config()
+    for index in range(trajectory.total_frames()):
+        state = trajectory.frame_array(index)
+        frame_count = index + 1
+        pos = state[:, :2].astype(float)
+        events = collision_events(frame_count, pos, config) if collisions else ()
+        pipeline.publish(frame_count, state, events)
+
+
+def render(config, num_frames, seed, output_dir, backend="agents", trajectory=None,
+           mapping="swarm", scale="major"):
+    """
+    Simulates one run and streams it into swarm_music.mid in output_dir,
+    and into a trajectory file if a path is given.
+    Returns a summary dict with the output files and timings.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    music_file = output_dir / "swarm_music.mid"
+    files = {"music": str(music_file)}
+
+    start = time.perf_counter()
+    music = MAPPERS[mapping](StreamingMidiWriter(music_file), scale=scale, width=config.width)
+    pipeline = FramePipeline([music])
+    if trajectory:
+        pipeline.subscribe(TrajectoryWriter(trajectory, config.num_agents, seed))
+        files["trajectory"] = str(trajectory)
+
+    elapsed, published = simulate(pipeline, config, num_frames, seed, backend, collisions=False)
+    pipeline.close()
+    music.save(music_file)
+
+    return {
+        "seed": seed,
+        "agents": config.num_agents,
+        "frames": num_frames,
+        "simulation_seconds": elapsed,
+        "publish_seconds": published,
+        "total_seconds": time.perf_counter() - start,
+        "frames_per_sec": num_frames / elapsed if elapsed > 0 else None,
+        "files": files,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render swarm music without a display.")
+    parser.add_argument("--agents", type=int, default=default_config().num_agents)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output-dir", default=Path(__file__).parent / "outputs")
+    parser.add_argument("--engine", choices=("agents", "arrays"), default="agents")
+    parser.add_argument("--synchronous", action="store_true")
+    parser.add_argument("--mapping", choices=sorted(MAPPERS), default="swarm",
+                        help="clusters: one voice per swarm cluster")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="major")
+    parser.add_argument("--trajectory", help="also write the run to this trajectory file")
+    parser.add_argument("--replay", help="skip simulation and render this trajectory file")
+    parser.add_argument("--width", type=float, default=default_config().width,
+                        help="world width; a replay needs the recorded run's")
+    parser.add_argument("--height", type=float, default=default_config().height,
+                        help="world height; a replay needs the recorded run's")
+    args = parser.parse_args()
+
+    config = replace(
+        default_config(),
+        num_agents=args.agents,
+        width=args.width,
+        height=args.height,
+        synchronous=args.synchronous or default_config().synchronous
+    )
+
+    if args.replay:
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        music_file = output_dir / "swarm_music.mid"
+
+        music = MAPPERS[args.mapping](StreamingMidiWriter(music_file), scale=args.scale,
+                                      width=config.width)
+        pipeline = FramePipeline([music])
+        trajectory = TrajectoryReader(args.replay)
+        replay(pipeline, trajectory, config, collisions=False)
+        pipeline.close()
+        music.save(music_file)
+        print(f"Replayed {trajectory.total_frames()} frames of {trajectory.num_agents} agents")
+        print(f"🎼 {music_file} generated")
+        return
+
+    result = render(config, args.frames, args.seed, args.output_dir,
+                    backend=args.engine, trajectory=args.trajectory,
+                    mapping=args.mapping, scale=args.scale)
+
+    print(f"Simulated {args.frames} frames of {args.agents} agents "
+          f"in {result['simulation_seconds']:.2f}s ({result['frames_per_sec'] or 0:.1f} frames/sec), "
+          f"published in {result['publish_seconds']:.2f}s")
+    print(f"🎼 {result['files']['music']} generated")
+
+
+if __name__ == "__main__":
+    main()
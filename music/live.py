@@ -0,0 +1,360 @@
+# live.py
+# ---------------- Live Output ----------------
+# Plays SwarmMusicMapper while the swarm is simulated instead of only
+# writing a file at the end.
+#
+#   LiveWriter     - a mapper writer whose tracks schedule events in time
+#   MidiPortSink   - sends the events to a (virtual) MIDI port
+#   SynthSink      - a small built-in synthesizer writing a WAV file
+#   LatencyMeter   - how late events left: after their frame's timestamp,
+#                    and after the time they were due
+#
+# Ticks become seconds through one running tick -> time map that only the
+# tempo set by energy_to_tempo moves, so notes keep the mapper's rhythm
+# whatever the frame rate does. A frame plays only once the music of the
+# frames before it is (nearly) over; frames that arrive while it is still
+# playing are dropped, their agents' pitches still carried by smoothing.
+
+import heapq
+import threading
+import time
+import wave
+from array import array
+
+import numpy as np
+from mido import Message
+
+from scales import BEND_RANGE
+
+
+# ---------------- LATENCY ----------------
+
+class LatencyMeter:
+    """Collects one latency, in seconds, for every event sent."""
+    def __init__(self):
+        self.samples = array('d')
+
+    def record(self, latency):
+        self.samples.append(latency)
+
+    def summary(self, frame_seconds=None):
+        """
+        Count, mean, median, 95th percentile and max latency in ms. Given
+        the length of one frame, also the share of events later than that.
+        """
+        if not self.samples:
+            return {"events": 0}
+        ms = np.frombuffer(self.samples, dtype=float) * 1000.0
+        result = {
+            "events": len(ms),
+            "mean_ms": float(ms.mean()),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "max_ms": float(ms.max()),
+        }
+        if frame_seconds is not None:
+            result["over_frame"] = float(np.mean(ms > frame_seconds * 1000.0))
+        return result
+
+
+# ---------------- TRACKS ----------------
+
+class LiveTrack:
+    """
+    Answers the TrackWriter calls by scheduling events on its LiveWriter.
+    Delta times add up to the absolute tick of every event, which the
+    writer turns into a wall time.
+    """
+    def __init__(self, writer, channel):
+        self.writer = writer
+        self.channel = channel
+        self.tick = 0
+
+    def _advance(self, time):
+        self.tick += time
+        return self.writer.tick_time(self.tick)
+
+    def _channel(self, channel):
+        """
+        The port channel of a channel the mapper wrote. Channels below the
+        number of tracks only keep tracks apart in a file (the bass of a
+        microtonal scale writes on 1) and become this track's own channel;
+        the rest pass through, but may not land on another track's channel.
+        """
+        tracks = self.writer.tracks
+        if channel < len(tracks):
+            return self.channel
+        if any(channel == track.channel for track in tracks):
+            raise ValueError(f"channel {channel} belongs to another live track")
+        return channel
+
+    def program_change(self, program, time=0, channel=0):
+        due = self._advance(time)
+        self.writer.schedule(due, Message('program_change', program=program, channel=self._channel(channel)))
+
+    def note_on(self, note, velocity, time=0, channel=0):
+        due = self._advance(time)
+        self.writer.schedule(due, Message('note_on', note=note, velocity=velocity, channel=self._channel(channel)))
+
+    def note_off(self, note, velocity=64, time=0, channel=0):
+        due = self._advance(time)
+        self.writer.schedule(due, Message('note_off', note=note, velocity=velocity, channel=self._channel(channel)))
+
+    def pitchwheel(self, pitch, time=0, channel=0):
+        due = self._advance(time)
+        self.writer.schedule(due, Message('pitchwheel', pitch=pitch, channel=self._channel(channel)))
+
+    def set_tempo(self, tempo, time=0):
+        # tempo is global, as in a MIDI file: it changes how every track
+        # turns ticks into seconds from here on
+        self._advance(time)
+        self.writer.change_tempo(self.tick, tempo)
+
+
+# ---------------- WRITER ----------------
+
+class LiveWriter:
+    """
+    Mapper writer that plays events through a sink at their wall-clock time.
+    Every track gets its own channel, and the channels the mapper uses to
+    lay tracks out in a file (0, or 1 for a microtonal bass) go out on it,
+    so melody and bass never share a channel on one port; higher channels,
+    like the cluster voices', are passed through. Either call pump()
+    regularly, e.g. once per frame, or start() a scheduler thread that sends
+    each event when it is due; close() at the end.
+
+    latency measures every event from its frame's timestamp, not counting
+    its place in the frame's music (the third melody note is meant to come
+    later); lateness measures it from its due time.
+    """
+    def __init__(self, sink, ticks_per_beat=480, clock=time.perf_counter, lookahead=0.01):
+        self.sink = sink
+        self.ticks_per_beat = ticks_per_beat
+        self.clock = clock
+        self.lookahead = lookahead  # how early a frame may start before its timestamp
+        self.tempo = 500000  # 120 BPM until the mapper sets one
+        self.tracks = []
+        self.queue = []  # (due, sequence, message, frame lead)
+        self.sequence = 0
+        self.latency = LatencyMeter()   # frame timestamp -> event
+        self.lateness = LatencyMeter()  # due time -> event
+        self.anchor_time = None
+        self.anchor_tick = 0
+        self.frame_lead = 0.0  # music start - timestamp of the frame being written
+        self.frames_played = 0
+        self.frames_dropped = 0
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def add_track(self):
+        channel = len(self.tracks)
+        if channel >= 9:
+            channel += 1  # skip the drum channel
+        track = LiveTrack(self, channel)
+        self.tracks.append(track)
+        return track
+
+    def ticks_to_seconds(self, ticks):
+        return ticks * self.tempo / (1_000_000 * self.ticks_per_beat)
+
+    def begin_frame(self, timestamp=None, tick=None):
+        """
+        Offers the frame starting at tick (default: the furthest any track
+        got), stamped timestamp (default: now). Returns whether to play it:
+        not while the music before tick is due more than lookahead after
+        the timestamp. When the music has already run out, the map moves on
+        so the frame starts at its timestamp after a rest.
+        """
+        if timestamp is None:
+            timestamp = self.clock()
+        if tick is None:
+            tick = max((track.tick for track in self.tracks), default=0)
+
+        if self.anchor_time is None:
+            self.anchor_time, self.anchor_tick = timestamp, tick
+        start = self.tick_time(tick)
+        if start > timestamp + self.lookahead:
+            self.frames_dropped += 1
+            return False
+        if start < timestamp:
+            self.anchor_time, self.anchor_tick = timestamp, tick
+            start = timestamp
+        self.frame_lead = start - timestamp
+        self.frames_played += 1
+        return True
+
+    def change_tempo(self, tick, tempo):
+        """Sets the tempo from tick on, keeping the time of every earlier tick."""
+        if self.anchor_time is not None:
+            self.anchor_time, self.anchor_tick = self.tick_time(tick), tick
+        self.tempo = tempo
+
+    def tick_time(self, tick):
+        """Wall time of an absolute tick, on the running tick -> time map."""
+        if self.anchor_time is None:
+            self.anchor_time = self.clock()
+        return self.anchor_time + self.ticks_to_seconds(tick - self.anchor_tick)
+
+    def schedule(self, due, message):
+        with self.condition:
+            heapq.heappush(self.queue, (due, self.sequence, message, self.frame_lead))
+            self.sequence += 1
+            if self.queue[0][0] == due:
+                self.condition.notify()
+
+    def pump(self, now=None):
+        """Sends every event that is due. Returns how many were sent."""
+        with self.condition:
+            if now is None:
+                now = self.clock()
+            sent = 0
+            while self.queue and self.queue[0][0] <= now:
+                due, _, message, lead = heapq.heappop(self.queue)
+                self.sink.send(message, due)
+                late = self.clock() - due
+                self.lateness.record(late)
+                self.latency.record(lead + late)
+                sent += 1
+            return sent
+
+    def next_due(self):
+        return self.queue[0][0] if self.queue else None
+
+    # ---------------- SCHEDULER THREAD ----------------
+
+    def start(self):
+        """Sends events from a background thread as they fall due."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        with self.condition:
+            while self.thread is not None:
+                due = self.next_due()
+                if due is None:
+                    self.condition.wait()
+                elif due > self.clock():
+                    self.condition.wait(due - self.clock())
+                else:
+                    self.pump()
+
+    def stop(self):
+        thread = self.thread
+        if thread is not None:
+            with self.condition:
+                self.thread = None
+                self.condition.notify()
+            thread.join()
+
+    def drain(self):
+        """Plays out everything still scheduled, sleeping until each is due."""
+        while self.queue:
+            wait = self.queue[0][0] - self.clock()
+            if wait > 0:
+                time.sleep(wait)
+            self.pump()
+
+    def close(self, drain=True):
+        self.stop()
+        if drain:
+            self.drain()
+        self.queue.clear()
+        self.sink.close()
+
+
+# ---------------- SINKS ----------------
+
+class MidiPortSink:
+    """Sends events to a MIDI output port, by default a new virtual one."""
+    def __init__(self, name="swarm2creative", virtual=True):
+        import mido
+        try:
+            self.port = mido.open_output(name, virtual=virtual)
+        except ImportError as exc:
+            raise RuntimeError(
+                "MIDI ports need the python-rtmidi backend (pip install python-rtmidi)"
+            ) from exc
+
+    def send(self, message, when):
+        self.port.send(message)
+
+    def close(self):
+        self.port.close()
+
+
+class SynthSink:
+    """
+    A small additive synthesizer writing 16-bit mono WAV. Audio is rendered
+    up to each event's due time, so the file keeps the scheduled timing no
+    matter how late the event was pumped. Program 32 (bass) gets a stronger
+    second harmonic; everything else is a plain sine.
+    """
+    def __init__(self, path, sample_rate=44100, gain=0.15, attack=0.005, release=0.05):
+        self.wav = wave.open(str(path), 'wb')
+        self.wav.setnchannels(1)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(sample_rate)
+        self.sample_rate = sample_rate
+        self.gain = gain
+        self.attack = attack
+        self.release = release
+        self.start = None       # wall time of sample 0
+        self.position = 0       # samples written
+        self.programs = {}      # channel -> program
+        self.bends = {}         # channel -> pitch-wheel value
+        self.voices = []        # [channel, note, velocity, on sample, off sample or None, bend]
+
+    def _sample(self, when):
+        if self.start is None:
+            self.start = when
+        return max(self.position, int(round((when - self.start) * self.sample_rate)))
+
+    def _render(self, end):
+        if end <= self.position:
+            return
+        n = np.arange(self.position, end)
+        out = np.zeros(len(n))
+        sr = self.sample_rate
+        for channel, note, velocity, on, off, bend in self.voices:
+            t = (n - on) / sr
+            freq = 440.0 * 2.0 ** ((note + bend * BEND_RANGE / 8192 - 69) / 12.0)
+            wave_ = np.sin(2 * np.pi * freq * t)
+            if self.programs.get(channel) == 32:
+                wave_ = 0.7 * wave_ + 0.3 * np.sin(4 * np.pi * freq * t)
+            env = np.minimum(1.0, t / self.attack)
+            if off is not None:
+                env *= np.clip(1.0 - (n - off) / (self.release * sr), 0.0, 1.0)
+            out += wave_ * env * (velocity / 127.0)
+        # soft clip keeps dense passages from wrapping around
+        pcm = (np.tanh(out * self.gain) * 32767).astype('<i2')
+        self.wav.writeframes(pcm.tobytes())
+        self.position = end
+
+        tail = int(self.release * sr)
+        self.voices = [v for v in self.voices if v[4] is None or v[4] + tail > end]
+
+    def send(self, message, when):
+        at = self._sample(when)
+        self._render(at)
+        if message.type == 'program_change':
+            self.programs[message.channel] = message.program
+        elif message.type == 'pitchwheel':
+            self.bends[message.channel] = message.pitch
+        elif message.type == 'note_on' and message.velocity > 0:
+            bend = self.bends.get(message.channel, 0)
+            self.voices.append([message.channel, message.note, message.velocity, at, None, bend])
+        elif message.type in ('note_on', 'note_off'):
+            # release the oldest sounding voice of that key
+            for voice in self.voices:
+                if voice[0] == message.channel and voice[1] == message.note and voice[4] is None:
+                    voice[4] = at
+                    break
+
+    def close(self):
+        # let every voice ring out its release
+        for voice in self.voices:
+            if voice[4] is None:
+                voice[4] = self.position
+        self._render(self.position + int(self.release * self.sample_rate))
+        self.wav.close()
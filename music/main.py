@@ -1,6 +1,15 @@
+import time
 import pygame
-from engine import Agent, WIDTH, HEIGHT, NUM_AGENTS
-from data_layer import SwarmStateBuffer, EventLogger
+from itertools import islice
+from engine import Agent, SpatialHash, step_agents, collision_pairs, positions, WIDTH, HEIGHT, NUM_AGENTS
+from data_layer import ColumnarSwarmStateBuffer, StructuredEventLogger
+
+# ---------------- Live Output ----------------
+# None    -> only write swarm_music.mid after the window closes
+# "port"  -> play through a virtual MIDI port while simulating
+# "synth" -> render the built-in synthesizer to outputs/swarm_live.wav
+LIVE_SINK = None
+FPS = 60
 
 pygame.init()
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -9,17 +18,33 @@ pygame.display.set_caption("Swarm Intelligence Engine")
 clock = pygame.time.Clock()
 
 # ---------------- Data Layer Initialization ----------------
-swarm_buffer = SwarmStateBuffer()
-event_logger = EventLogger()
+swarm_buffer = ColumnarSwarmStateBuffer()
+event_logger = StructuredEventLogger()
 frame_count = 0
 
 # ---------------- Agents ----------------
 agents = [Agent() for _ in range(NUM_AGENTS)]
+grid = SpatialHash()
+
+live = None
+if LIVE_SINK:
+    from pathlib import Path
+    from live import LiveWriter, MidiPortSink, SynthSink
+    from music_mapper import SwarmMusicMapper
+
+    if LIVE_SINK == "port":
+        sink = MidiPortSink()
+    else:
+        (Path(__file__).parent / "outputs").mkdir(exist_ok=True)
+        sink = SynthSink(Path(__file__).parent / "outputs" / "swarm_live.wav")
+    live = SwarmMusicMapper(LiveWriter(sink))
+    live.writer.start()
 
 running = True
 while running:
-    clock.tick(60)  # FPS
+    clock.tick(FPS)
     frame_count += 1
+    frame_start = time.perf_counter()
 
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
@@ -27,11 +52,10 @@ while running:
 
     screen.fill((0, 0, 0))  # black background
 
-    for agent in agents:
-        agent.apply_behaviors(agents)
-        agent.update()
-        agent.edges()
+    grid.rebuild(agents)
+    step_agents(agents, grid)
 
+    for agent in agents:
         # draw agent
         pygame.draw.circle(
             screen,
@@ -43,11 +67,13 @@ while running:
     # ---------------- Log Data Layer ----------------
     swarm_buffer.log_frame(agents)
 
-    # Example: log collisions if agents get too close
-    for i, a1 in enumerate(agents):
-        for j, a2 in enumerate(agents[i+1:], start=i+1):
-            if a1.pos.distance_to(a2.pos) < 5:  # collision threshold
-                event_logger.log_event(frame_count, "collision", {"agents": (i, j)})
+    # log collisions if agents get too close
+    event_logger.log_events_bulk(frame_count, "collision", collision_pairs(positions(agents)))
+
+    # ---------------- Live Music ----------------
+    if live:
+        live.add_frame(swarm_buffer.get_frame(swarm_buffer.total_frames() - 1), timestamp=frame_start)
+        live.writer.pump()
 
     # -------------------------------------------------
 
@@ -55,9 +81,14 @@ while running:
 
 pygame.quit()
 
+if live:
+    live.writer.close()
+    print("Live latency (frame timestamp -> event):", live.writer.latency.summary(1 / FPS))
+    print("Live frames played / dropped:", live.writer.frames_played, "/", live.writer.frames_dropped)
+
 # ---------------- Optional: Save / inspect logged data ----------------
 print("Total frames logged:", swarm_buffer.total_frames())
-print("Sample events logged:", event_logger.get_events()[:5])  # print first 5 events
+print("Sample events logged:", list(islice(event_logger, 5)))  # print first 5 events
 
 from pathlib import Path
 from music_mapper import SwarmMusicMapper
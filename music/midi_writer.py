@@ -0,0 +1,305 @@
+# midi_writer.py
+# ---------------- MIDI Writers ----------------
+# Track writers for SwarmMusicMapper. Every writer hands out tracks with
+# the same calls (program_change, note_on, note_off, pitchwheel, set_tempo),
+# so the mapper does not care which one it is talking to.
+#
+#   MidoWriter          - builds a mido MidiFile, one Message object per event
+#   MidiWriter          - encodes events straight into a byte buffer per track
+#   StreamingMidiWriter - like MidiWriter, but flushes to disk as it goes
+
+import os
+import shutil
+import struct
+
+from mido import Message, MetaMessage, MidiFile, MidiTrack
+
+
+def encode_varlen(value):
+    """Standard MIDI variable-length quantity."""
+    out = bytearray([value & 0x7F])
+    value >>= 7
+    while value:
+        out.insert(0, (value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(out)
+
+
+def midi_chunk(name, data):
+    return name + struct.pack('>L', len(data)) + bytes(data)
+
+
+END_OF_TRACK = b'\x00\xff\x2f\x00'
+
+
+# ---------------- DIRECT ----------------
+
+class TrackWriter:
+    """
+    One MTrk worth of delta-time encoded events in a bytearray.
+    Uses running status the same way mido does, so files match byte for byte.
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.running_status = None
+
+    def _channel_event(self, status, time, data):
+        self.data += encode_varlen(time)
+        if status != self.running_status:
+            self.data.append(status)
+            self.running_status = status
+        self.data += data
+
+    def program_change(self, program, time=0, channel=0):
+        self._channel_event(0xC0 | channel, time, bytes((program,)))
+
+    def note_on(self, note, velocity, time=0, channel=0):
+        self._channel_event(0x90 | channel, time, bytes((note, velocity)))
+
+    def note_off(self, note, velocity=64, time=0, channel=0):
+        self._channel_event(0x80 | channel, time, bytes((note, velocity)))
+
+    def pitchwheel(self, pitch, time=0, channel=0):
+        value = pitch + 8192
+        self._channel_event(0xE0 | channel, time, bytes((value & 0x7F, value >> 7)))
+
+    def set_tempo(self, tempo, time=0):
+        self.data += encode_varlen(time)
+        self.data += b'\xff\x51\x03' + tempo.to_bytes(3, 'big')
+        self.running_status = None
+
+    def chunk(self):
+        """The finished MTrk chunk, with end_of_track appended."""
+        return midi_chunk(b'MTrk', self.data + END_OF_TRACK)
+
+
+class MidiWriter:
+    """
+    Writes a Standard MIDI File from TrackWriters in one pass,
+    without building a Message object per event.
+    """
+    def __init__(self, ticks_per_beat=480, midi_type=1):
+        self.ticks_per_beat = ticks_per_beat
+        self.midi_type = midi_type
+        self.tracks = []
+
+    def add_track(self):
+        track = TrackWriter()
+        self.tracks.append(track)
+        return track
+
+    def to_bytes(self):
+        header = struct.pack('>hhh', self.midi_type, len(self.tracks), self.ticks_per_beat)
+        return midi_chunk(b'MThd', header) + b''.join(t.chunk() for t in self.tracks)
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.to_bytes())
+
+
+# ---------------- STREAMING ----------------
+
+class StreamingTrackWriter(TrackWriter):
+    """TrackWriter that hands its bytes to a file every flush_bytes."""
+    def __init__(self, file, flush_bytes):
+        super().__init__()
+        self.file = file
+        self.flush_bytes = flush_bytes
+        self.length = 0  # bytes already written to file
+
+    def _channel_event(self, status, time, data):
+        super()._channel_event(status, time, data)
+        if len(self.data) >= self.flush_bytes:
+            self.flush()
+
+    def set_tempo(self, tempo, time=0):
+        super().set_tempo(tempo, time)
+        if len(self.data) >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.data)
+        self.length += len(self.data)
+        self.data = bytearray()
+
+
+class StreamingMidiWriter:
+    """
+    Writes a Standard MIDI File while events arrive, in constant memory.
+    The first track streams into the file itself; later tracks stream into
+    "<path>.trackN.part" spool files. close() appends the spools as their
+    own MTrk chunks and patches the chunk lengths and track count.
+    A file left behind by a crash can be repaired with recover_midi().
+    """
+    def __init__(self, path, ticks_per_beat=480, midi_type=1, flush_bytes=4096):
+        self.path = str(path)
+        self.ticks_per_beat = ticks_per_beat
+        self.midi_type = midi_type
+        self.flush_bytes = flush_bytes
+        self.tracks = []
+        self.file = open(self.path, 'wb')
+        # one track until close(), so an interrupted file stays readable
+        self.file.write(midi_chunk(b'MThd', struct.pack('>hhh', midi_type, 1, ticks_per_beat)))
+        self.closed = False
+
+    def add_track(self):
+        if not self.tracks:
+            self.file.write(b'MTrk' + struct.pack('>L', 0))
+            target = self.file
+        else:
+            target = open(spool_path(self.path, len(self.tracks)), 'w+b')
+        track = StreamingTrackWriter(target, self.flush_bytes)
+        self.tracks.append(track)
+        return track
+
+    def flush(self):
+        for track in self.tracks:
+            track.flush()
+            track.file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+
+        if self.tracks:
+            first = self.tracks[0]
+            self.file.write(END_OF_TRACK)
+            self.file.seek(14 + 4)
+            self.file.write(struct.pack('>L', first.length + len(END_OF_TRACK)))
+            self.file.seek(0, os.SEEK_END)
+
+        for index, track in enumerate(self.tracks[1:], start=1):
+            self.file.write(b'MTrk' + struct.pack('>L', track.length + len(END_OF_TRACK)))
+            track.file.seek(0)
+            shutil.copyfileobj(track.file, self.file)
+            self.file.write(END_OF_TRACK)
+            track.file.close()
+            os.remove(spool_path(self.path, index))
+
+        self.file.seek(8)
+        self.file.write(struct.pack('>hhh', self.midi_type, len(self.tracks), self.ticks_per_beat))
+        self.file.close()
+        self.closed = True
+
+    def save(self, filename=None):
+        """Finishes the file; moves it to filename if that differs from path."""
+        self.close()
+        if filename is not None and os.path.abspath(filename) != os.path.abspath(self.path):
+            os.replace(self.path, filename)
+            self.path = str(filename)
+
+
+def spool_path(path, index):
+    return f"{path}.track{index}.part"
+
+
+def _complete_events(data, start=0):
+    """
+    Returns the offset just past the last complete event in an MTrk body,
+    stopping before end_of_track or a truncated event.
+    """
+    pos = end = start
+    status = None
+    n = len(data)
+    try:
+        while pos < n:
+            # delta time
+            while data[pos] & 0x80:
+                pos += 1
+            pos += 1
+
+            byte = data[pos]
+            if byte == 0xFF:
+                if data[pos + 1] == 0x2F:
+                    break
+                pos += 2
+                length = 0
+                while data[pos] & 0x80:
+                    length = (length << 7) | (data[pos] & 0x7F)
+                    pos += 1
+                length = (length << 7) | data[pos]
+                pos += 1 + length
+                status = None
+            else:
+                if byte & 0x80:
+                    status = byte
+                    pos += 1
+                elif status is None:
+                    break
+                pos += 1 if status & 0xF0 in (0xC0, 0xD0) else 2
+
+            if pos > n:
+                break
+            end = pos
+    except IndexError:
+        pass
+    return end
+
+
+def recover_midi(path):
+    """
+    Repairs a file left by an interrupted StreamingMidiWriter: keeps every
+    complete event, closes the first track, re-attaches any spooled tracks
+    and fixes the header. Returns the number of tracks recovered.
+    """
+    path = str(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    midi_type, num_tracks, ticks_per_beat = struct.unpack('>hhh', data[8:14])
+    if struct.unpack('>L', data[18:22])[0]:
+        return num_tracks  # lengths were patched, the file was closed cleanly
+
+    bodies = [data[22:_complete_events(data, 22)]]
+
+    index = 1
+    while os.path.exists(spool_path(path, index)):
+        with open(spool_path(path, index), 'rb') as f:
+            spooled = f.read()
+        bodies.append(spooled[:_complete_events(spooled)])
+        index += 1
+
+    with open(path, 'wb') as f:
+        f.write(midi_chunk(b'MThd', struct.pack('>hhh', midi_type, len(bodies), ticks_per_beat)))
+        for body in bodies:
+            f.write(midi_chunk(b'MTrk', body + END_OF_TRACK))
+
+    for index in range(1, len(bodies)):
+        os.remove(spool_path(path, index))
+    return len(bodies)
+
+
+# ---------------- MIDO ----------------
+
+class MidoTrack(MidiTrack):
+    """A mido MidiTrack that also answers the TrackWriter calls."""
+
+    def program_change(self, program, time=0, channel=0):
+        self.append(Message('program_change', program=program, time=time, channel=channel))
+
+    def note_on(self, note, velocity, time=0, channel=0):
+        self.append(Message('note_on', note=note, velocity=velocity, time=time, channel=channel))
+
+    def note_off(self, note, velocity=64, time=0, channel=0):
+        self.append(Message('note_off', note=note, velocity=velocity, time=time, channel=channel))
+
+    def pitchwheel(self, pitch, time=0, channel=0):
+        self.append(Message('pitchwheel', pitch=pitch, time=time, channel=channel))
+
+    def set_tempo(self, tempo, time=0):
+        self.append(MetaMessage('set_tempo', tempo=tempo, time=time))
+
+
+class MidoWriter:
+    """Collects tracks into a mido MidiFile (available as .mid)."""
+    def __init__(self, ticks_per_beat=480, midi_type=1):
+        self.mid = MidiFile(type=midi_type, ticks_per_beat=ticks_per_beat)
+
+    def add_track(self):
+        track = MidoTrack()
+        self.mid.tracks.append(track)
+        return track
+
+    def save(self, filename):
+        self.mid.save(filename)
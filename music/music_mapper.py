@@ -1,122 +1,318 @@
 # music_mapper.py
 import math
-from mido import Message, MidiFile, MidiTrack, MetaMessage
-
-
-WIDTH = 900  # same as engine
-SCALE = [60, 62, 64, 65, 67, 69, 71]  # C Major
+import numpy as np
+
+from engine import WIDTH
+from midi_writer import MidoWriter
+from scales import Quantizer, get_scale
+
+
+MELODY_VOICES = 3  # loudest agents played per frame
+
+
+def frame_array(frame):
+    """
+    Returns an (agents, 4) float array of x, y, vx, vy for one frame,
+    either a FrameView (no copy of the rows) or a list of agent dicts.
+    """
+    array = getattr(frame, "array", None)
+    if array is not None:
+        return np.asarray(array, dtype=float)
+    return np.array([a['pos'] + a['vel'] for a in frame], dtype=float).reshape(-1, 4)
+
+
+def _segments(indices, table):
+    """
+    Cuts a sequence of scale indices into about sqrt(n) segments and builds
+    every segment's composed smoothing table side by side. Returns the
+    step tables (one extra identity row pads the last segment), the padded
+    (segments, size) indices and the (segments, states) composed tables.
+    """
+    states = table.shape[1]
+    steps = np.vstack((table, np.arange(states, dtype=table.dtype)))
+    size = max(1, math.isqrt(len(indices)))
+    segments = -(-len(indices) // size)
+    idx = np.full(segments * size, len(table))
+    idx[:len(indices)] = indices
+    idx = idx.reshape(segments, size)
+
+    composed = np.tile(np.arange(states, dtype=table.dtype), (segments, 1))
+    for c in range(size):
+        composed = steps[idx[:, c, np.newaxis], composed]
+    return steps, idx, composed
+
+
+def compose_smoothing(indices, table):
+    """
+    The smoothing of a whole sequence of scale indices as one table:
+    result[last pitch - lowest] is the pitch - lowest after the last step.
+    """
+    result = np.arange(table.shape[1], dtype=table.dtype)
+    if len(indices):
+        for row in _segments(np.asarray(indices), table)[2]:
+            result = row[result]
+    return result
+
+
+def smooth_pitches(indices, last_pitch, scale, lo, table):
+    """
+    Runs the melody smoothing over a sequence of scale indices in one go.
+    Each step is a lookup table over the few reachable pitches, so the
+    sequence is cut into segments whose composed tables are built side by
+    side; a short walk over the segments then gives each segment's start
+    pitch, and all segments are played forward together.
+    Returns the smoothed pitch of every step.
+    """
+    indices = np.asarray(indices)
+    n = len(indices)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    out = np.empty(n, dtype=np.int64)
+    if last_pitch is None:
+        # the first note takes its target directly
+        out[0] = scale[indices[0]]
+        last_pitch = int(out[0])
+        indices, rest = indices[1:], out[1:]
+    else:
+        rest = out
+    if not len(indices):
+        return out
+
+    steps, idx, composed = _segments(indices, table)
+    segments, size = idx.shape
+
+    starts = []
+    state = last_pitch - lo
+    for row in composed.tolist():
+        starts.append(state)
+        state = row[state]
+
+    current = np.array(starts)
+    played = np.empty((segments, size), dtype=np.int64)
+    for c in range(size):
+        current = steps[idx[:, c], current]
+        played[:, c] = current
+
+    rest[:] = played.ravel()[:len(indices)] + lo
+    return out
+
+
+def top_volumes(volumes, k):
+    """
+    Indices of the k loudest agents, loudest first, ties in agent order,
+    as sorted(..., reverse=True)[:k] would pick them. Uses a partial
+    selection instead of a full sort.
+    """
+    n = len(volumes)
+    # unique key: volume first, then earlier agents win ties
+    key = volumes.astype(np.int64) * n + (n - 1 - np.arange(n))
+    if n > k:
+        top = np.argpartition(-key, k - 1)[:k]
+    else:
+        top = np.arange(n)
+    return top[np.argsort(-key[top])]
 
 
 class SwarmMusicMapper:
-    def __init__(self):
-        self.mid = MidiFile()
+    def __init__(self, writer=None, scale="major", width=WIDTH):
+        # MidoWriter builds a mido MidiFile; midi_writer.MidiWriter encodes
+        # the same bytes directly without a Message object per event
+        self.writer = writer or MidoWriter()
+        self.mid = getattr(self.writer, "mid", None)
+
+        # ---- SCALE ----
+        # scales.SCALES holds the named scales; x maps across the world width
+        self.scale = get_scale(scale)
+        self.width = width
+        self.quantizer = Quantizer(self.scale, width)
+        self.pitch_floor, self.pitch_table = self.scale.smoothing_table()
+        # pitch bends are per channel: keep the bass off the melody's
+        self.bass_channel = 1 if self.scale.microtonal else 0
+
+        # ---- CONDUCTOR TRACK ----
+        # type 1: the tempo map lives on track 0 and applies to every track
+        self.conductor = self.writer.add_track()
 
         # ---- MELODY TRACK ----
-        self.melody = MidiTrack()
-        self.mid.tracks.append(self.melody)
-        self.melody.append(Message('program_change', program=48, time=0))
+        self.melody = self.writer.add_track()
+        self.melody.program_change(48, time=0)
 
         # ---- BASS TRACK ----
-        self.bass = MidiTrack()
-        self.mid.tracks.append(self.bass)
-        self.bass.append(Message('program_change', program=32, time=0))
+        self.bass = self.writer.add_track()
+        self.bass.program_change(32, time=0, channel=self.bass_channel)
 
         self.last_pitch = None
         self.frame_count = 0
 
+        # absolute tick where the next frame starts, and of every
+        # track's last event
+        self.frame_tick = 0
+        self.ticks = {"conductor": 0, "melody": 0, "bass": 0}
+
         # ---- TEMPO ----
         self.base_tempo = 500000  # 120 BPM
         self.current_tempo = self.base_tempo
 
-        # set initial tempo (must be on track 0)
-        self.melody.append(
-            MetaMessage('set_tempo', tempo=self.base_tempo, time=0)
-        )
+        # set initial tempo
+        self.conductor.set_tempo(self.base_tempo, time=0)
 
     # ---------------- UTILS ----------------
 
-    def speed(self, vel):
-        return math.sqrt(vel[0] ** 2 + vel[1] ** 2)
-
-    def compute_swarm_energy(self, frame):
-        return sum(self.speed(a['vel']) for a in frame) / len(frame)
-
     def energy_to_tempo(self, energy):
         bpm = 60 + energy * 20
         bpm = max(60, min(140, bpm))
         return int(60_000_000 / bpm)
 
-    # ---------------- MELODY ----------------
-
-    def melody_notes(self, frame):
-        notes = []
-        for agent in frame:
-            x, _ = agent['pos']
-            vel = agent['vel']
-
-            idx = int((x / WIDTH) * len(SCALE))
-            idx = min(idx, len(SCALE) - 1)
-            target = SCALE[idx]
-
-            if self.last_pitch is None:
-                pitch = target
-            else:
-                pitch = int(self.last_pitch * 0.7 + target * 0.3)
-
-            self.last_pitch = pitch
-
-            volume = int(min(127, self.speed(vel) * 40))
-            notes.append((pitch, volume))
-
-        return sorted(notes, key=lambda n: n[1], reverse=True)
-
-    # ---------------- BASS ----------------
-
-    def bass_note(self, frame):
-        avg_x = sum(a['pos'][0] for a in frame) / len(frame)
-        idx = int((avg_x / WIDTH) * len(SCALE))
-        idx = min(idx, len(SCALE) - 1)
-
-        # Bass = root note two octaves down
-        return SCALE[idx] - 24
+    # ---------------- FEATURES ----------------
+
+    def frame_features(self, block):
+        """
+        Extracts the features of a block of frames, shaped (frames, agents, 4),
+        in one array pass. Returns a dict with per-frame 'energy' and 'avg_x'
+        and per-agent 'speed', 'scale_idx' and 'volume' arrays.
+        """
+        x = block[:, :, 0]
+        vx = block[:, :, 2]
+        vy = block[:, :, 3]
+
+        speed = np.sqrt(vx * vx + vy * vy)
+        scale_idx = self.quantizer.indices(x)
+        volume = np.minimum(127, speed * 40).astype(np.int64)
+
+        energy = speed.mean(axis=1)
+        avg_x = x.mean(axis=1)
+
+        return {
+            "energy": energy,
+            "avg_x": avg_x,
+            "speed": speed,
+            "scale_idx": scale_idx,
+            "volume": volume,
+        }
 
     # ---------------- FRAME ----------------
 
-    def add_frame(self, frame):
-        self.frame_count += 1
-
-        # ---- TEMPO ----
-        energy = self.compute_swarm_energy(frame)
-        tempo = self.energy_to_tempo(energy)
-
-        if tempo != self.current_tempo:
-            self.melody.append(
-                MetaMessage('set_tempo', tempo=tempo, time=0)
-            )
-            self.current_tempo = tempo
-
-        duration = int(100 + energy * 30)
+    def add_frame(self, frame, timestamp=None):
+        self.add_frames(frame_array(frame)[np.newaxis],
+                        None if timestamp is None else [timestamp])
+
+    def add_frames(self, block, timestamps=None):
+        """
+        Maps a block of frames, shaped (frames, agents, 4), e.g. from
+        ColumnarSwarmStateBuffer.block() or a TrajectoryReader.
+        Timestamps, one per frame, anchor the frames of a live writer.
+        """
+        block = np.asarray(block, dtype=float)
+        num_frames, n = block.shape[:2]
+        features = self.frame_features(block)
+
+        # smoothing runs over every agent of every frame in order
+        pitches = smooth_pitches(
+            features["scale_idx"].ravel(), self.last_pitch,
+            self.scale.pitches, self.pitch_floor, self.pitch_table
+        ).reshape(num_frames, n)
+        if pitches.size:
+            self.last_pitch = int(pitches[-1, -1])
+
+        melodies = []
+        for f in range(num_frames):
+            top = top_volumes(features["volume"][f], MELODY_VOICES)
+            melodies.append(list(zip(pitches[f, top].tolist(), features["volume"][f, top].tolist())))
+        self._emit_frames(features["energy"], features["avg_x"], melodies, timestamps)
+
+    # ---------------- EMIT ----------------
+
+    def _at(self, track, tick):
+        """Delta time for an event of track at an absolute tick."""
+        delta = max(0, tick - self.ticks[track])
+        self.ticks[track] += delta
+        return delta
+
+    def frame_length(self, melody, duration):
+        # melody notes play one after the other
+        return len(melody) * duration
+
+    def _emit_frames(self, energy, avg_x, melodies, timestamps=None):
+        """
+        Writes a block of frames. Every frame starts at an absolute tick,
+        after the previous frame's melody, so each track is written on its
+        own: the conductor gets the tempo changes, then melody and bass
+        their notes, all placed at the frames' ticks.
+        """
+        begin_frame = getattr(self.writer, "begin_frame", None)
+        if timestamps is not None and begin_frame is not None:
+            # a live writer plays events as they come: go frame by frame,
+            # leaving out frames it has no time for yet
+            for f in range(len(energy)):
+                if begin_frame(timestamps[f], self.frame_tick):
+                    self._emit_frames(energy[f:f + 1], avg_x[f:f + 1], melodies[f:f + 1])
+            return
+
+        tempos = [self.energy_to_tempo(e) for e in energy]
+        durations = [int(100 + e * 30) for e in energy]
+        starts = []
+        tick = self.frame_tick
+        for melody, duration in zip(melodies, durations):
+            starts.append(tick)
+            tick += self.frame_length(melody, duration)
+        first_frame = self.frame_count + 1
+        self.frame_count += len(energy)
+        self.frame_tick = tick
+
+        # ---- TEMPO (conductor) ----
+        for start, tempo in zip(starts, tempos):
+            if tempo != self.current_tempo:
+                self.conductor.set_tempo(tempo, time=self._at("conductor", start))
+                self.current_tempo = tempo
 
         # ---- MELODY (every frame) ----
-        melody = self.melody_notes(frame)[:3]
-        for pitch, volume in melody:
-            self.melody.append(
-                Message('note_on', note=pitch, velocity=volume, time=0)
-            )
-            self.melody.append(
-                Message('note_off', note=pitch, velocity=64, time=duration)
-            )
+        for start, melody, duration in zip(starts, melodies, durations):
+            self._emit_melody(melody, duration, start)
 
         # ---- BASS (every 8 frames) ----
-        if self.frame_count % 8 == 0:
-            bass_pitch = self.bass_note(frame)
-
-            self.bass.append(
-                Message('note_on', note=bass_pitch, velocity=70, time=0)
-            )
-            self.bass.append(
-                Message('note_off', note=bass_pitch, velocity=64, time=duration * 4)
-            )
+        for f, start in enumerate(starts):
+            if (first_frame + f) % 8 == 0:
+                bass_pitch = self.scale.pitches[self.quantizer.index(avg_x[f])] + self.scale.octaves(-2)
+                self._note(self.bass, "bass", bass_pitch, 70, start, start + durations[f] * 4,
+                           self.bass_channel)
+
+    def _emit_melody(self, melody, duration, start):
+        for k, (pitch, volume) in enumerate(melody):
+            on = start + k * duration
+            self._note(self.melody, "melody", pitch, volume, on, on + duration)
+
+    def _note(self, track, name, pitch, volume, on, off, channel=0):
+        """One note of a pitch in scale steps, bent into tune if microtonal."""
+        note, bend = self.scale.to_midi(pitch)
+        if self.scale.microtonal:
+            track.pitchwheel(bend, time=self._at(name, on), channel=channel)
+        track.note_on(note, volume, time=self._at(name, on), channel=channel)
+        track.note_off(note, 64, time=self._at(name, off), channel=channel)
+
+    # ---------------- STATE ----------------
+
+    def get_state(self):
+        """Everything a frame depends on from the frames before it."""
+        return {
+            "last_pitch": self.last_pitch,
+            "frame_count": self.frame_count,
+            "frame_tick": self.frame_tick,
+            "ticks": dict(self.ticks),
+            "current_tempo": self.current_tempo,
+        }
+
+    def set_state(self, state):
+        """Continues from a get_state() taken after an earlier frame."""
+        self.last_pitch = state["last_pitch"]
+        self.frame_count = state["frame_count"]
+        self.frame_tick = state["frame_tick"]
+        self.ticks = dict(state["ticks"])
+        self.current_tempo = state["current_tempo"]
+
+    def on_frame(self, frame_number, frame, events):
+        """FramePipeline subscriber: maps frames as they are simulated."""
+        self.add_frame(frame)
 
     def save(self, filename="swarm_music.mid"):
-        self.mid.save(filename)
+        self.writer.save(filename)
@@ -0,0 +1,133 @@
+# scales.py
+# ---------------- Scales ----------------
+# Musical scales for the mappers, and the lookup tables that turn an
+# agent's x position into a scale degree and pitch for a whole frame at once.
+#
+# Pitches are counted in steps: a semitone is steps_per_semitone steps, so
+# ordinary scales use plain MIDI note numbers and microtonal ones (e.g.
+# quarter tones, 2 steps per semitone) still smooth on integers. A pitch
+# is played as a MIDI note plus a pitch-wheel bend.
+
+import numpy as np
+
+BEND_RANGE = 2  # semitones a full pitch-wheel throw bends (the GM default)
+
+
+class Scale:
+    """
+    A scale as degrees in semitones above root. Degrees may be fractional
+    when steps_per_semitone makes them whole steps (3.5 with 2 steps).
+    """
+    def __init__(self, name, degrees, root=60, steps_per_semitone=1):
+        self.name = name
+        self.degrees = list(degrees)
+        self.root = root
+        self.steps_per_semitone = steps_per_semitone
+
+        steps = [(root + d) * steps_per_semitone for d in self.degrees]
+        if any(s != int(s) for s in steps):
+            raise ValueError(f"{name}: degrees must be whole steps of 1/{steps_per_semitone} semitone")
+        self.pitches = [int(s) for s in steps]
+        self._smoothing = None
+
+    def __len__(self):
+        return len(self.pitches)
+
+    def __repr__(self):
+        return f"Scale({self.name!r}, {self.degrees}, root={self.root})"
+
+    @property
+    def microtonal(self):
+        return self.steps_per_semitone != 1
+
+    def octaves(self, count):
+        """Steps in count octaves, e.g. -2 for the bass two octaves down."""
+        return 12 * self.steps_per_semitone * count
+
+    def to_midi(self, pitch):
+        """(MIDI note, pitch-wheel value) sounding a pitch given in steps."""
+        note, rest = divmod(pitch, self.steps_per_semitone)
+        bend = round(rest / self.steps_per_semitone * 8192 / BEND_RANGE)
+        return note, bend
+
+    def smoothing_table(self):
+        """
+        Precomputes melody smoothing, int(last * 0.7 + target * 0.3), for
+        every reachable last pitch. Returns (lowest pitch, table) where
+        table[scale index, pitch - lowest] is the next pitch - lowest.
+        """
+        if self._smoothing is None:
+            reachable = set(self.pitches)
+            while True:
+                grown = reachable | {int(p * 0.7 + t * 0.3) for p in reachable for t in self.pitches}
+                if grown == reachable:
+                    break
+                reachable = grown
+
+            lo, hi = min(reachable), max(reachable)
+            table = np.array(
+                [[int(p * 0.7 + t * 0.3) - lo for p in range(lo, hi + 1)] for t in self.pitches],
+                dtype=np.int16
+            )
+            self._smoothing = (lo, table)
+        return self._smoothing
+
+
+SCALES = {
+    "major": Scale("major", [0, 2, 4, 5, 7, 9, 11]),
+    "minor": Scale("minor", [0, 2, 3, 5, 7, 8, 10]),
+    "pentatonic": Scale("pentatonic", [0, 2, 4, 7, 9]),
+    "minor_pentatonic": Scale("minor_pentatonic", [0, 3, 5, 7, 10]),
+    "blues": Scale("blues", [0, 3, 5, 6, 7, 10]),
+    # Maqam Rast: neutral third and seventh, a quarter tone flat
+    "rast": Scale("rast", [0, 2, 3.5, 5, 7, 9, 10.5], steps_per_semitone=2),
+    # every quarter tone of the octave
+    "quarter_tone": Scale("quarter_tone", [k / 2 for k in range(24)], steps_per_semitone=2),
+}
+
+
+def get_scale(scale):
+    """A Scale from a name in SCALES, or the Scale itself."""
+    if isinstance(scale, Scale):
+        return scale
+    try:
+        return SCALES[scale]
+    except KeyError:
+        raise ValueError(f"unknown scale {scale!r}, expected one of {sorted(SCALES)}") from None
+
+
+class Quantizer:
+    """
+    Maps x positions across a world width to scale degrees and pitches.
+    The degree boundaries are precomputed as the exact smallest x of each
+    degree, so one searchsorted over a frame gives the same degree as
+    min(int(x / width * len(scale)), len(scale) - 1) per agent.
+    """
+    def __init__(self, scale, width):
+        self.scale = get_scale(scale)
+        self.width = width
+        n = len(self.scale)
+
+        edges = [-np.inf]
+        for k in range(1, n):
+            x = k * width / n
+            # nudge onto the first float whose degree really is k
+            while int(x / width * n) >= k:
+                x = np.nextafter(x, -np.inf)
+            while int(x / width * n) < k:
+                x = np.nextafter(x, np.inf)
+            edges.append(x)
+        self.edges = np.array(edges)
+        self.table = np.array(self.scale.pitches, dtype=np.int64)
+
+    def index(self, x):
+        """Scale degree of one x position."""
+        return int(np.searchsorted(self.edges, x, side='right')) - 1
+
+    def indices(self, x):
+        """Scale degree of every x in an array."""
+        return np.searchsorted(self.edges, x, side='right') - 1
+
+    def pitches(self, x):
+        """Unsmoothed pitch of every x in an array."""
+        return self.table[self.indices(x)]
@@ -3,6 +3,11 @@
 # Stores and manages swarm state for creative mapping
 
 import copy
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
 
 class SwarmStateBuffer:
     """
@@ -42,6 +47,291 @@ class SwarmStateBuffer:
         return len(self.frames)
 
 
+def agent_state_array(agents):
+    """
+    Returns an (N, 4) array of x, y, vx, vy for a list of agents.
+    A SwarmArrays, or the list of its agent views, is read without a Python loop.
+    """
+    swarm = getattr(agents, "swarm", None)
+    if swarm is None and len(agents) and hasattr(agents[0], "swarm"):
+        if len(agents) == len(agents[0].swarm):
+            swarm = agents[0].swarm
+    if swarm is None and isinstance(getattr(agents, "pos", None), np.ndarray):
+        swarm = agents
+
+    if swarm is not None:
+        return np.hstack((swarm.pos, swarm.vel))
+    return np.array(
+        [(a.pos.x, a.pos.y, a.vel.x, a.vel.y) for a in agents], dtype=float
+    ).reshape(-1, 4)
+
+
+class AgentState:
+    """
+    Read-only view of one agent row, indexed like the dicts of
+    SwarmStateBuffer: state['pos'] -> (x, y), state['vel'] -> (vx, vy).
+    """
+    __slots__ = ("row",)
+
+    def __init__(self, row):
+        self.row = row
+
+    def __getitem__(self, key):
+        if key == 'pos':
+            return (float(self.row[0]), float(self.row[1]))
+        if key == 'vel':
+            return (float(self.row[2]), float(self.row[3]))
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return ('pos', 'vel')
+
+
+class FrameView:
+    """
+    Zero-copy view of one logged frame that behaves like a list of agent
+    states. The raw (agents, 4) float32 rows are available as .array.
+    """
+    __slots__ = ("array",)
+
+    def __init__(self, array):
+        self.array = array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrameView(self.array[index])
+        return AgentState(self.array[index])
+
+    def __iter__(self):
+        for row in self.array:
+            yield AgentState(row)
+
+
+class FrameSequence:
+    """
+    List-like access to the frames of a buffer, one FrameView at a time;
+    a slice gives a list of FrameViews.
+    """
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self):
+        return self.buffer.total_frames()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.buffer.get_frame(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        frame = self.buffer.get_frame(index)
+        if frame is None:
+            raise IndexError(index)
+        return frame
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.buffer.get_frame(index)
+
+
+class ColumnarSwarmStateBuffer:
+    """
+    Array-backed drop-in for SwarmStateBuffer.
+    Frames are stored as float32 rows of (x, y, vx, vy) in chunks of shape
+    (chunk_frames, agents, 4), so memory is 16 bytes per agent-frame.
+    """
+    def __init__(self, num_agents=None, chunk_frames=1024):
+        self.num_agents = num_agents
+        self.chunk_frames = chunk_frames
+        self.chunks = []
+        self.count = 0
+
+    @property
+    def frames(self):
+        return FrameSequence(self)
+
+    def log_frame(self, agents):
+        """
+        Logs the current state of all agents as one (agents, 4) row block.
+        """
+        self.append_array(agent_state_array(agents))
+
+    def append_array(self, state):
+        """Logs one frame given as an (agents, 4) array."""
+        if self.num_agents is None:
+            self.num_agents = len(state)
+
+        offset = self.count % self.chunk_frames
+        if offset == 0:
+            self.chunks.append(
+                np.empty((self.chunk_frames, self.num_agents, 4), dtype=np.float32)
+            )
+        self.chunks[-1][offset] = state
+        self.count += 1
+
+    def on_frame(self, frame_number, frame, events):
+        self.append_array(frame.array)
+
+    def frame_array(self, index):
+        """Returns the (agents, 4) float32 rows of a frame, without copying."""
+        chunk, offset = divmod(index, self.chunk_frames)
+        return self.chunks[chunk][offset]
+
+    def block(self, start, stop):
+        """
+        Returns frames [start, stop) as a (frames, agents, 4) array.
+        A view when the range sits inside one chunk, otherwise a copy.
+        """
+        stop = min(stop, self.count)
+        if start >= stop:
+            return np.empty((0, self.num_agents or 0, 4), dtype=np.float32)
+        first, last = start // self.chunk_frames, (stop - 1) // self.chunk_frames
+        if first == last:
+            base = first * self.chunk_frames
+            return self.chunks[first][start - base:stop - base]
+        return np.concatenate([
+            self.block(max(start, c * self.chunk_frames), min(stop, (c + 1) * self.chunk_frames))
+            for c in range(first, last + 1)
+        ])
+
+    def get_frame(self, index):
+        """
+        Returns a zero-copy FrameView of a specific frame.
+        """
+        if 0 <= index < self.count:
+            return FrameView(self.frame_array(index))
+        else:
+            return None
+
+    def clear(self):
+        """Clears all logged frames."""
+        self.chunks = []
+        self.count = 0
+
+    def total_frames(self):
+        return self.count
+
+
+# ---------------- Trajectory Files ----------------
+# Header: magic, version, agents, dims, frame count, seed (-1 if unseeded),
+# padded to 64 bytes, then one little-endian float32 record per frame.
+
+TRAJECTORY_MAGIC = b"SWRMTRAJ"
+TRAJECTORY_VERSION = 1
+TRAJECTORY_HEADER = struct.Struct("<8sIIIQq28x")
+
+
+class TrajectoryWriter:
+    """
+    Appends frames to a binary trajectory file as they are logged.
+    The frame count in the header is patched on close(); a file from a
+    killed run is still readable up to its last complete frame.
+    """
+    def __init__(self, path, num_agents, seed=None, dims=4):
+        self.path = path
+        self.num_agents = num_agents
+        self.dims = dims
+        self.seed = seed
+        self.count = 0
+        self.file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        self.file.seek(0)
+        self.file.write(TRAJECTORY_HEADER.pack(
+            TRAJECTORY_MAGIC, TRAJECTORY_VERSION, self.num_agents, self.dims,
+            self.count, -1 if self.seed is None else self.seed
+        ))
+
+    def log_frame(self, agents):
+        """Appends the current state of all agents, like SwarmStateBuffer."""
+        self.write_array(agent_state_array(agents))
+
+    def write_array(self, state):
+        """Appends one (agents, dims) frame."""
+        state = np.ascontiguousarray(state, dtype="<f4")
+        if state.shape != (self.num_agents, self.dims):
+            raise ValueError(f"expected frame shape {(self.num_agents, self.dims)}, got {state.shape}")
+        self.file.write(state.tobytes())
+        self.count += 1
+
+    def on_frame(self, frame_number, frame, events):
+        self.write_array(frame.array)
+
+    def total_frames(self):
+        return self.count
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._write_header()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Memory-maps a trajectory file for random access to any frame.
+    Offers the read side of ColumnarSwarmStateBuffer (frames, get_frame,
+    block, total_frames) without loading the run into memory.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(TRAJECTORY_HEADER.size)
+        if len(header) < TRAJECTORY_HEADER.size:
+            raise ValueError(f"{path} is too short to be a trajectory file")
+
+        magic, version, self.num_agents, self.dims, count, seed = TRAJECTORY_HEADER.unpack(header)
+        if magic != TRAJECTORY_MAGIC or version != TRAJECTORY_VERSION:
+            raise ValueError(f"{path} is not a version {TRAJECTORY_VERSION} trajectory file")
+        self.seed = None if seed < 0 else seed
+
+        frame_bytes = self.num_agents * self.dims * 4
+        on_disk = (os.path.getsize(path) - TRAJECTORY_HEADER.size) // max(frame_bytes, 1)
+        # an unclosed file has count 0 in its header; trust whole records instead
+        self.count = count if 0 < count <= on_disk else on_disk
+
+        shape = (self.count, self.num_agents, self.dims)
+        if self.count and frame_bytes:
+            self.data = np.memmap(path, dtype="<f4", mode="r",
+                                  offset=TRAJECTORY_HEADER.size, shape=shape)
+        else:
+            self.data = np.empty(shape, dtype="<f4")
+
+    @property
+    def frames(self):
+        return FrameSequence(self)
+
+    def frame_array(self, index):
+        return self.data[index]
+
+    def block(self, start, stop):
+        return self.data[start:stop]
+
+    def get_frame(self, index):
+        if 0 <= index < self.count:
+            return FrameView(self.data[index])
+        else:
+            return None
+
+    def total_frames(self):
+        return self.count
+
+
 class EventLogger:
     """
     Logs events in the swarm, e.g., collisions, group merges, density changes.
@@ -60,8 +350,231 @@ class EventLogger:
         }
         self.events.append(event)
 
+    def log_events_bulk(self, frame_number, event_type, pairs):
+        """
+        Log one event per agent pair, e.g. all collisions of a frame at once.
+        """
+        self.events.extend(
+            {'frame': frame_number, 'type': event_type, 'info': {'agents': tuple(pair)}}
+            for pair in np.asarray(pairs).tolist()
+        )
+
     def get_events(self):
         return self.events
 
     def clear(self):
         self.events = []
+
+
+class EventRecord(namedtuple("EventRecord", "frame type agents")):
+    """Lightweight event yielded by StructuredEventLogger."""
+    __slots__ = ()
+
+
+class FrameEvents:
+    """
+    One frame's events in bulk form: an (M, 2) array of agent pairs per
+    event type, and a list of agent groups per event type. Iterating
+    yields EventRecords, pairs first, so it can stand in for a list of
+    them; loggers and mappers that know it read the arrays directly.
+    """
+    __slots__ = ("frame", "pairs", "groups")
+
+    def __init__(self, frame, pairs=None, groups=None):
+        self.frame = frame
+        self.pairs = pairs or {}    # event type -> (M, 2) int array
+        self.groups = groups or {}  # event type -> list of agent tuples
+
+    def __len__(self):
+        return sum(len(p) for p in self.pairs.values()) + sum(len(g) for g in self.groups.values())
+
+    def __iter__(self):
+        for event_type, pairs in self.pairs.items():
+            for pair in np.asarray(pairs).tolist():
+                yield EventRecord(self.frame, event_type, tuple(pair))
+        for event_type, groups in self.groups.items():
+            for group in groups:
+                yield EventRecord(self.frame, event_type, tuple(group))
+
+
+class StructuredEventLogger:
+    """
+    Event store with typed columns instead of a list of dicts.
+    Parallel arrays hold frame, type code and agent a/b per event; events
+    with more agents keep their members in a flat group array.
+    """
+    def __init__(self, capacity=1024):
+        self.type_codes = {}   # event type name -> code
+        self.type_names = []   # code -> event type name
+        self.count = 0
+        self.frame = np.empty(capacity, dtype=np.int64)
+        self.type = np.empty(capacity, dtype=np.int16)
+        self.a = np.empty(capacity, dtype=np.int32)
+        self.b = np.empty(capacity, dtype=np.int32)
+        # group events: offset into members, -1 for pair / empty events
+        self.group_start = np.empty(capacity, dtype=np.int64)
+        self.group_size = np.empty(capacity, dtype=np.int32)
+        self.member_count = 0
+        self.members = np.empty(capacity, dtype=np.int32)
+
+    def _code(self, event_type):
+        code = self.type_codes.get(event_type)
+        if code is None:
+            code = self.type_codes[event_type] = len(self.type_names)
+            self.type_names.append(event_type)
+        return code
+
+    def _reserve(self, extra_events, extra_members=0):
+        needed = self.count + extra_events
+        if needed > len(self.frame):
+            size = max(needed, 2 * len(self.frame))
+            for name in ("frame", "type", "a", "b", "group_start", "group_size"):
+                column = getattr(self, name)
+                grown = np.empty(size, dtype=column.dtype)
+                grown[:self.count] = column[:self.count]
+                setattr(self, name, grown)
+
+        needed = self.member_count + extra_members
+        if needed > len(self.members):
+            grown = np.empty(max(needed, 2 * len(self.members)), dtype=np.int32)
+            grown[:self.member_count] = self.members[:self.member_count]
+            self.members = grown
+
+    def log_event(self, frame_number, event_type, info=None):
+        """
+        Log an event that happened during the simulation.
+        Same call as EventLogger.log_event; only info['agents'] is kept.
+        """
+        agents = (info or {}).get('agents', ())
+        if len(agents) == 2:
+            self.log_events_bulk(frame_number, event_type, [agents])
+        else:
+            self.log_groups_bulk(frame_number, event_type, [agents])
+
+    def log_events_bulk(self, frame_number, event_type, pairs):
+        """
+        Log one event per agent pair, e.g. all collisions of a frame at once.
+        """
+        pairs = np.asarray(pairs, dtype=np.int32).reshape(-1, 2)
+        n = len(pairs)
+        self._reserve(n)
+        end = self.count + n
+        self.frame[self.count:end] = frame_number
+        self.type[self.count:end] = self._code(event_type)
+        self.a[self.count:end] = pairs[:, 0]
+        self.b[self.count:end] = pairs[:, 1]
+        self.group_start[self.count:end] = -1
+        self.group_size[self.count:end] = 0
+        self.count = end
+
+    def log_groups_bulk(self, frame_number, event_type, groups):
+        """
+        Log one event per agent group (any size), e.g. proximity clusters.
+        """
+        sizes = np.array([len(g) for g in groups], dtype=np.int32)
+        n, total = len(sizes), int(sizes.sum())
+        self._reserve(n, total)
+
+        end = self.count + n
+        self.frame[self.count:end] = frame_number
+        self.type[self.count:end] = self._code(event_type)
+        self.a[self.count:end] = -1
+        self.b[self.count:end] = -1
+        self.group_start[self.count:end] = self.member_count + np.cumsum(sizes) - sizes
+        self.group_size[self.count:end] = sizes
+        if total:
+            self.members[self.member_count:self.member_count + total] = np.concatenate(
+                [np.asarray(g, dtype=np.int32) for g in groups]
+            )
+        self.count = end
+        self.member_count += total
+
+    def on_frame(self, frame_number, frame, events):
+        """
+        FramePipeline subscriber: logs a frame's events with one bulk call
+        per event type, pairs and groups apart.
+        """
+        if isinstance(events, FrameEvents):
+            for event_type, pairs in events.pairs.items():
+                self.log_events_bulk(events.frame, event_type, pairs)
+            for event_type, groups in events.groups.items():
+                self.log_groups_bulk(events.frame, event_type, groups)
+            return
+        pairs, groups = {}, {}
+        for event in events:
+            runs = pairs if len(event.agents) == 2 else groups
+            runs.setdefault((event.frame, event.type), []).append(event.agents)
+        for (frame_number, event_type), run in pairs.items():
+            self.log_events_bulk(frame_number, event_type, run)
+        for (frame_number, event_type), run in groups.items():
+            self.log_groups_bulk(frame_number, event_type, run)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        names = self.type_names
+        members = self.members
+        n = self.count
+        for frame, code, a, b, start, size in zip(
+            self.frame[:n].tolist(), self.type[:n].tolist(),
+            self.a[:n].tolist(), self.b[:n].tolist(),
+            self.group_start[:n].tolist(), self.group_size[:n].tolist()
+        ):
+            if start >= 0:
+                agents = tuple(members[start:start + size].tolist())
+            else:
+                agents = (a, b) if a >= 0 else ()
+            yield EventRecord(frame, names[code], agents)
+
+    def max_frame(self):
+        """Highest logged frame number, or -1 if nothing was logged."""
+        return int(self.frame[:self.count].max()) if self.count else -1
+
+    def get_events(self):
+        """Events as EventLogger-style dicts, for existing readers."""
+        return [
+            {'frame': e.frame, 'type': e.type, 'info': {'agents': e.agents} if e.agents else {}}
+            for e in self
+        ]
+
+    def clear(self):
+        self.count = 0
+        self.member_count = 0
+
+
+# ---------------- Streaming ----------------
+
+class FramePipeline:
+    """
+    Hands every frame to its subscribers as soon as it is simulated.
+    A subscriber is any object with on_frame(frame_number, frame, events)
+    and, optionally, close(). The pipeline keeps nothing between frames,
+    so its memory does not grow with the length of the run.
+    """
+    def __init__(self, subscribers=()):
+        self.subscribers = list(subscribers)
+        self.frames_published = 0
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def publish(self, frame_number, state, events=()):
+        """
+        Publishes one frame, given as an (agents, 4) array or anything
+        agent_state_array() accepts, with its events: a FrameEvents or a
+        list of EventRecords.
+        """
+        if not isinstance(state, np.ndarray):
+            state = agent_state_array(state)
+        frame = FrameView(state.astype(np.float32))
+        for subscriber in self.subscribers:
+            subscriber.on_frame(frame_number, frame, events)
+        self.frames_published += 1
+
+    def close(self):
+        for subscriber in self.subscribers:
+            close = getattr(subscriber, "close", None)
+            if close is not None:
+                close()
@@ -1,4 +1,7 @@
 import random
+from dataclasses import dataclass
+
+import numpy as np
 import pygame
 from pygame.math import Vector2
 
@@ -12,9 +15,45 @@ MAX_SPEED = 3
 ALIGNMENT_STRENGTH = 0.05
 COHESION_STRENGTH = 0.01
 SEPARATION_STRENGTH = 0.08
+
+COLLISION_DISTANCE = 5
+
+# agents chained closer than this form a proximity group (alliances)
+PROXIMITY_RADIUS = 20
+
+# steer every agent from the frame-t snapshot, then move them all
+SYNCHRONOUS = False
 # ----------------------------------------
 
 
+@dataclass
+class SwarmConfig:
+    """
+    One set of the settings above. A config travels with its swarm, so
+    several configurations can run in one process or in worker processes.
+    """
+    num_agents: int = NUM_AGENTS
+    width: float = WIDTH
+    height: float = HEIGHT
+    neighbor_radius: float = NEIGHBOR_RADIUS
+    max_speed: float = MAX_SPEED
+    alignment_strength: float = ALIGNMENT_STRENGTH
+    cohesion_strength: float = COHESION_STRENGTH
+    separation_strength: float = SEPARATION_STRENGTH
+    collision_distance: float = COLLISION_DISTANCE
+    proximity_radius: float = PROXIMITY_RADIUS
+    synchronous: bool = SYNCHRONOUS
+
+
+def default_config():
+    """A SwarmConfig holding the current values of the module settings."""
+    return SwarmConfig(
+        NUM_AGENTS, WIDTH, HEIGHT, NEIGHBOR_RADIUS, MAX_SPEED,
+        ALIGNMENT_STRENGTH, COHESION_STRENGTH, SEPARATION_STRENGTH,
+        COLLISION_DISTANCE, PROXIMITY_RADIUS, SYNCHRONOUS
+    )
+
+
 def limit_speed(v, max_speed):
     if v.length() > max_speed:
         v.scale_to_length(max_speed)
@@ -30,6 +69,113 @@ def get_neighbors(agent, agents, radius):
     return neighbors
 
 
+class SpatialHash:
+    """
+    Uniform grid over the world with cells at least NEIGHBOR_RADIUS wide.
+    Rebuild it once per frame and share it between all agents; query()
+    returns the same neighbors, in the same order, as get_neighbors().
+    """
+    def __init__(self, radius=NEIGHBOR_RADIUS, margin=MAX_SPEED,
+                 width=WIDTH, height=HEIGHT):
+        self.radius = radius
+        # agents hashed at the start of the frame may already have moved
+        # by up to MAX_SPEED when they are queried, so look a bit further
+        self.reach = radius + margin
+        self.cols = max(1, int(width // radius))
+        self.rows = max(1, int(height // radius))
+        self.cell_w = width / self.cols
+        self.cell_h = height / self.rows
+        self.agents = []
+        self.cells = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.neighbor_radius, config.max_speed, config.width, config.height)
+
+    def cell(self, pos):
+        # wrap like Agent.edges, so pos == WIDTH lands next to pos == 0
+        return (int(pos.x // self.cell_w) % self.cols,
+                int(pos.y // self.cell_h) % self.rows)
+
+    def rebuild(self, agents):
+        self.agents = list(agents)
+        self.cells = {}
+        for i, agent in enumerate(self.agents):
+            self.cells.setdefault(self.cell(agent.pos), []).append(i)
+
+    def _span(self, lo, hi, size, count):
+        first = int(lo // size)
+        last = int(hi // size)
+        if last - first + 1 >= count:
+            return range(count)
+        return {c % count for c in range(first, last + 1)}
+
+    def query(self, agent):
+        x, y = agent.pos.x, agent.pos.y
+        cols = self._span(x - self.reach, x + self.reach, self.cell_w, self.cols)
+        rows = self._span(y - self.reach, y + self.reach, self.cell_h, self.rows)
+
+        candidates = []
+        for cx in cols:
+            for cy in rows:
+                candidates.extend(self.cells.get((cx, cy), ()))
+        candidates.sort()  # keep list order so steering sums match
+
+        neighbors = []
+        for i in candidates:
+            other = self.agents[i]
+            if other != agent:
+                if agent.pos.distance_to(other.pos) < self.radius:
+                    neighbors.append(other)
+        return neighbors
+
+
+def neighbor_pairs(pos, radius, width=WIDTH, height=HEIGHT, chunk_size=4096):
+    """
+    Yields (i, j) index arrays of all ordered pairs i != j closer than
+    radius, sorted by i then j, using the same grid as SpatialHash.
+    Sources are processed chunk_size at a time to bound memory.
+    """
+    n = len(pos)
+    cols = max(1, int(width // radius))
+    rows = max(1, int(height // radius))
+    cx = np.clip((pos[:, 0] // (width / cols)).astype(np.int64), 0, cols - 1)
+    cy = np.clip((pos[:, 1] // (height / rows)).astype(np.int64), 0, rows - 1)
+
+    cells = cx * rows + cy
+    order = np.argsort(cells, kind="stable")
+    bounds = np.arange(cols * rows + 1)
+    starts = np.searchsorted(cells[order], bounds[:-1])
+    ends = np.searchsorted(cells[order], bounds[1:])
+
+    for lo in range(0, n, chunk_size):
+        src = np.arange(lo, min(lo + chunk_size, n))
+        all_i, all_j = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                nx = cx[src] + dx
+                ny = cy[src] + dy
+                ok = (nx >= 0) & (nx < cols) & (ny >= 0) & (ny < rows)
+                s = starts[nx[ok] * rows + ny[ok]]
+                counts = ends[nx[ok] * rows + ny[ok]] - s
+                total = counts.sum()
+                if total == 0:
+                    continue
+                offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                all_i.append(np.repeat(src[ok], counts))
+                all_j.append(order[np.repeat(s, counts) + offsets])
+
+        if not all_i:
+            continue
+        i = np.concatenate(all_i)
+        j = np.concatenate(all_j)
+        d = pos[i] - pos[j]
+        close = (i != j) & (np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]) < radius)
+        i, j = i[close], j[close]
+        keep = np.argsort(i * n + j)
+        yield i[keep], j[keep]
+
+
 def alignment(agent, neighbors):
     if not neighbors:
         return Vector2()
@@ -55,35 +201,346 @@ def separation(agent, neighbors):
 
 
 class Agent:
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = config or default_config()
         self.pos = Vector2(
-            random.uniform(0, WIDTH),
-            random.uniform(0, HEIGHT)
+            random.uniform(0, self.config.width),
+            random.uniform(0, self.config.height)
         )
         angle = random.uniform(0, 360)
         self.vel = Vector2(1, 0).rotate(angle)
 
-    def apply_behaviors(self, agents):
-        neighbors = get_neighbors(self, agents, NEIGHBOR_RADIUS)
+    def steer(self, agents, grid=None):
+        """Returns the next velocity without changing the agent."""
+        config = self.config
+        if grid is not None:
+            neighbors = grid.query(self)
+        else:
+            neighbors = get_neighbors(self, agents, config.neighbor_radius)
+
+        align = alignment(self, neighbors) * config.alignment_strength
+        coh = cohesion(self, neighbors) * config.cohesion_strength
+        sep = separation(self, neighbors) * config.separation_strength
 
-        align = alignment(self, neighbors) * ALIGNMENT_STRENGTH
-        coh = cohesion(self, neighbors) * COHESION_STRENGTH
-        sep = separation(self, neighbors) * SEPARATION_STRENGTH
+        return limit_speed(self.vel + (align + coh + sep), config.max_speed)
 
-        self.vel += align + coh + sep
-        self.vel = limit_speed(self.vel, MAX_SPEED)
+    def apply_behaviors(self, agents, grid=None):
+        self.vel = self.steer(agents, grid)
 
     def update(self):
         self.pos += self.vel
 
     def edges(self):
+        width, height = self.config.width, self.config.height
         if self.pos.x < 0:
-            self.pos.x = WIDTH
-        elif self.pos.x > WIDTH:
+            self.pos.x = width
+        elif self.pos.x > width:
             self.pos.x = 0
 
         if self.pos.y < 0:
-            self.pos.y = HEIGHT
-        elif self.pos.y > HEIGHT:
+            self.pos.y = height
+        elif self.pos.y > height:
             self.pos.y = 0
 
+
+def step_agents(agents, grid=None, synchronous=None):
+    """
+    Advances a list of Agent objects by one frame.
+    Sequential mode moves each agent before the next one steers, so results
+    depend on list order. Synchronous mode computes every steering from the
+    frame-t state first and commits them together, which matches SwarmArrays.
+    """
+    if synchronous is None:
+        synchronous = agents[0].config.synchronous if agents else SYNCHRONOUS
+
+    if synchronous:
+        velocities = [agent.steer(agents, grid) for agent in agents]
+        for agent, vel in zip(agents, velocities):
+            agent.vel = vel
+            agent.update()
+            agent.edges()
+    else:
+        for agent in agents:
+            agent.apply_behaviors(agents, grid)
+            agent.update()
+            agent.edges()
+
+
+
+# ---------------- ARRAY ENGINE ----------------
+
+class AgentView:
+    """
+    Read-only stand-in for an Agent, backed by one row of a SwarmArrays.
+    Lets SwarmStateBuffer.log_frame and drawing code keep using .pos/.vel.
+    """
+    __slots__ = ("swarm", "index")
+
+    def __init__(self, swarm, index):
+        self.swarm = swarm
+        self.index = index
+
+    @property
+    def pos(self):
+        return Vector2(self.swarm.pos[self.index].tolist())
+
+    @property
+    def vel(self):
+        return Vector2(self.swarm.vel[self.index].tolist())
+
+
+class SwarmArrays:
+    """
+    Structure-of-arrays swarm: all positions and velocities live in
+    contiguous (N, 2) float arrays and a whole frame is stepped at once.
+    Every agent steers from the same frame-t state.
+    """
+    def __init__(self, num_agents=None, seed=None, config=None):
+        self.config = config or default_config()
+        if num_agents is None:
+            num_agents = self.config.num_agents
+        rng = np.random.default_rng(seed)
+        self.pos = np.column_stack((
+            rng.uniform(0, self.config.width, num_agents),
+            rng.uniform(0, self.config.height, num_agents)
+        ))
+        angle = np.radians(rng.uniform(0, 360, num_agents))
+        self.vel = np.column_stack((np.cos(angle), np.sin(angle)))
+        self.agents = [AgentView(self, i) for i in range(num_agents)]
+
+    @classmethod
+    def from_agents(cls, agents, config=None):
+        """Builds an array swarm holding the current state of Agent objects."""
+        if config is None and agents:
+            config = agents[0].config
+        swarm = cls(0, config=config)
+        swarm.pos = np.array([(a.pos.x, a.pos.y) for a in agents], dtype=float).reshape(-1, 2)
+        swarm.vel = np.array([(a.vel.x, a.vel.y) for a in agents], dtype=float).reshape(-1, 2)
+        swarm.agents = [AgentView(swarm, i) for i in range(len(agents))]
+        return swarm
+
+    def __len__(self):
+        return len(self.pos)
+
+    def step(self):
+        n = len(self.pos)
+        pos, vel = self.pos, self.vel
+        config = self.config
+
+        # per-agent neighbor sums, accumulated in neighbor order like Agent
+        count = np.zeros(n)
+        sums = np.zeros((6, n))  # vel x/y, pos x/y, separation x/y
+        for i, j in neighbor_pairs(pos, config.neighbor_radius, config.width, config.height):
+            diff = pos[i] - pos[j]
+            dist = np.sqrt(diff[:, 0] * diff[:, 0] + diff[:, 1] * diff[:, 1])
+            inv_dist = np.zeros_like(dist)
+            np.divide(1.0, dist, out=inv_dist, where=dist > 0)
+            away = diff * inv_dist[:, None]
+
+            count += np.bincount(i, minlength=n)
+            for k, w in enumerate((vel[j, 0], vel[j, 1], pos[j, 0], pos[j, 1],
+                                   away[:, 0], away[:, 1])):
+                sums[k] += np.bincount(i, weights=w, minlength=n)
+
+        has = (count > 0)[:, None]
+        # Vector2 / n multiplies by the reciprocal; do the same bit for bit
+        inv = (1.0 / np.maximum(count, 1))[:, None]
+        align = np.where(has, sums[0:2].T * inv - vel, 0.0) * config.alignment_strength
+        coh = np.where(has, sums[2:4].T * inv - pos, 0.0) * config.cohesion_strength
+        sep = sums[4:6].T * config.separation_strength
+
+        vel = vel + (align + coh + sep)
+
+        # limit_speed
+        speed = np.sqrt(vel[:, 0] * vel[:, 0] + vel[:, 1] * vel[:, 1])
+        fast = speed > config.max_speed
+        vel[fast] *= (config.max_speed / speed[fast])[:, None]
+
+        # update + edges
+        pos = pos + vel
+        for axis, size in ((0, config.width), (1, config.height)):
+            col = pos[:, axis]
+            low = col < 0
+            high = col > size
+            col[low] = size
+            col[high] = 0
+
+        self.pos, self.vel = pos, vel
+
+
+# ---------------- COLLISIONS ----------------
+
+def positions(agents):
+    """
+    Returns an (N, 2) array of agent positions.
+    Free for a SwarmArrays or its agent views, one pass for Agent objects.
+    """
+    if isinstance(agents, SwarmArrays):
+        return agents.pos
+    if agents and isinstance(agents[0], AgentView) and len(agents) == len(agents[0].swarm):
+        return agents[0].swarm.pos
+    return np.array([(a.pos.x, a.pos.y) for a in agents], dtype=float).reshape(-1, 2)
+
+
+def collision_pairs(pos, threshold=COLLISION_DISTANCE, width=WIDTH, height=HEIGHT):
+    """
+    Returns an (M, 2) int array of index pairs i < j closer than threshold,
+    in the same order as a double loop over all pairs. Uses the grid from
+    neighbor_pairs with cells keyed on the threshold.
+    """
+    found = [
+        np.column_stack((i[i < j], j[i < j]))
+        for i, j in neighbor_pairs(pos, threshold, width, height)
+    ]
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(found)
+
+
+# ---------------- CLUSTERS ----------------
+
+def connected_components(n, i, j):
+    """
+    Labels n nodes by connected component over the edges (i, j). Each
+    component is labelled with its smallest node index. Roots are hooked
+    onto the smaller root across every edge, then pointer jumping flattens
+    the forest, until no edge joins two labels.
+    """
+    labels = np.arange(n)
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    while True:
+        li, lj = labels[i], labels[j]
+        differ = li != lj
+        if not differ.any():
+            return labels
+        i, j = i[differ], j[differ]
+        np.minimum.at(labels, np.maximum(li, lj)[differ], np.minimum(li, lj)[differ])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+
+def cluster_labels(pos, radius=NEIGHBOR_RADIUS, width=WIDTH, height=HEIGHT):
+    """Component label of every agent over the graph of agents closer than radius."""
+    i, j = [], []
+    for src, dst in neighbor_pairs(pos, radius, width, height):
+        i.append(src)
+        j.append(dst)
+    if not i:
+        return np.arange(len(pos))
+    return connected_components(len(pos), np.concatenate(i), np.concatenate(j))
+
+
+def cluster_groups(labels, min_size=2):
+    """
+    Member index arrays of every component with at least min_size agents,
+    members ascending, components ordered by their smallest member.
+    """
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    groups = np.split(order, starts[1:])
+    return [g for g in groups if len(g) >= min_size]
+
+
+def proximity_groups(pos, radius=PROXIMITY_RADIUS, min_size=3, width=WIDTH, height=HEIGHT):
+    """
+    Groups of at least min_size agents chained closer than radius, as
+    sorted member tuples (a canonical key for the group), ordered by their
+    smallest member. Connected components over the grid-built neighbor
+    graph, so it scales with the number of close pairs, not N^3.
+    """
+    labels = cluster_labels(pos, radius, width, height)
+    return [tuple(g.tolist()) for g in cluster_groups(labels, min_size)]
+
+
+class ClusterTracker:
+    """
+    Gives groups of agents stable ids from frame to frame. A group keeps
+    the id of the track it overlaps most (Jaccard similarity of members, at
+    least min_jaccard), each track going to one group at most; the rest
+    start new tracks. A track's streak counts the frames it has been seen
+    since it started; tracks unseen for more than max_idle frames are
+    evicted, so a group that breaks up for longer starts over. Candidates
+    come from an inverted index of agent -> track.
+    """
+    def __init__(self, min_jaccard=0.3, max_idle=0):
+        self.min_jaccard = min_jaccard
+        self.max_idle = max_idle
+        self.members = {}     # track id -> member index array
+        self.first_seen = {}  # track id -> frame
+        self.last_seen = {}   # track id -> frame
+        self.streak = {}      # track id -> frames seen since the track started
+        self.agent_track = {}  # agent index -> track id
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.members)
+
+    def match(self, groups):
+        """Track id (or None) for every group, by greedy Jaccard matching."""
+        candidates = []
+        for g, group in enumerate(groups):
+            overlaps = {}
+            for agent in group.tolist():
+                track = self.agent_track.get(agent)
+                if track is not None:
+                    overlaps[track] = overlaps.get(track, 0) + 1
+            for track, shared in overlaps.items():
+                jaccard = shared / (len(group) + len(self.members[track]) - shared)
+                if jaccard >= self.min_jaccard:
+                    candidates.append((-jaccard, g, track))
+
+        matched = [None] * len(groups)
+        taken = set()
+        for _, g, track in sorted(candidates):
+            if matched[g] is None and track not in taken:
+                matched[g] = track
+                taken.add(track)
+        return matched
+
+    def observe(self, track, group, frame):
+        """Stores a group as the latest members of track and extends its streak."""
+        for agent in self.members.get(track, np.empty(0, dtype=np.int64)).tolist():
+            if self.agent_track.get(agent) == track:
+                del self.agent_track[agent]
+        self.members[track] = group
+        self.first_seen.setdefault(track, frame)
+        if self.last_seen.get(track) != frame:
+            self.streak[track] = self.streak.get(track, 0) + 1
+        self.last_seen[track] = frame
+        for agent in group.tolist():
+            self.agent_track[agent] = track
+
+    def evict(self, frame):
+        """
+        Drops tracks that were unseen for more than max_idle frames before
+        frame; returns their ids.
+        """
+        stale = [t for t, seen in self.last_seen.items() if frame - seen - 1 > self.max_idle]
+        for track in stale:
+            for agent in self.members.pop(track).tolist():
+                if self.agent_track.get(agent) == track:
+                    del self.agent_track[agent]
+            del self.first_seen[track]
+            del self.last_seen[track]
+            del self.streak[track]
+        return stale
+
+    def update(self, groups, frame):
+        """
+        Evicts, matches and observes for one frame; returns the group ids.
+        Frames without groups may be skipped: eviction goes by frame number.
+        """
+        groups = [np.asarray(group) for group in groups]
+        self.evict(frame)
+        ids = self.match(groups)
+        for g, group in enumerate(groups):
+            if ids[g] is None:
+                ids[g] = self.next_id
+                self.next_id += 1
+            self.observe(ids[g], group, frame)
+        return ids
@@ -0,0 +1,217 @@
+# headless.py
+# ---------------- Headless Runner ----------------
+# Runs the swarm without a display, as fast as the CPU allows,
+# and streams every frame's events into the story mapper.
+#
+#   python headless.py --agents 500 --frames 2000 --seed 7 --output-dir outputs
+#   python headless.py --frames 500000 --stream   # narrate while it runs
+#   python headless.py --agents 5000 --top-k 5      # 5 beats per 300 frames
+
+import argparse
+import json
+import random
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from engine import (
+    Agent, SpatialHash, SwarmArrays, default_config,
+    step_agents, collision_pairs, positions, proximity_groups
+)
+from data_layer import (
+    FrameEvents, FramePipeline, TrajectoryReader, TrajectoryWriter, agent_state_array
+)
+from story_mapper import StoryAggregator, StoryMapper, StoryStreamWriter
+
+
+def frame_events(frame_number, pos, config):
+    """
+    All story events of one frame: the colliding pairs as one (M, 2)
+    array, and every proximity group of 3+ agents.
+    """
+    pairs = collision_pairs(pos, config.collision_distance, config.width, config.height)
+    groups = proximity_groups(pos, config.proximity_radius, 3, config.width, config.height)
+    return FrameEvents(frame_number, {"collision": pairs}, {"proximity": groups})
+
+
+def simulate(pipeline, config, num_frames=600, seed=None,
+             backend="agents", collisions=True):
+    """
+    Steps the swarm num_frames times without drawing or frame capping and
+    publishes every frame, with its collision and proximity events, to the
+    pipeline.
+    Returns (seconds stepping the swarm, seconds finding events and
+    publishing), so mapping and output do not count as simulation.
+    """
+    random.seed(seed)
+
+    if backend == "arrays":
+        swarm = SwarmArrays(config.num_agents, seed, config)
+        agents = swarm.agents
+    else:
+        swarm = None
+        agents = [Agent(config) for _ in range(config.num_agents)]
+        grid = SpatialHash.from_config(config)
+
+    stepping = publishing = 0.0
+    for frame_count in range(1, num_frames + 1):
+        start = time.perf_counter()
+        if swarm is not None:
+            swarm.step()
+        else:
+            grid.rebuild(agents)
+            step_agents(agents, grid)
+        stepped = time.perf_counter()
+        stepping += stepped - start
+
+        events = frame_events(frame_count, positions(agents), config) if collisions else ()
+        pipeline.publish(frame_count, agent_state_array(agents), events)
+        publishing += time.perf_counter() - stepped
+
+    return stepping, publishing
+
+
+def replay(pipeline, trajectory, config=None, collisions=True):
+    """Publishes the frames of a stored run, rebuilding their events."""
+    config = config or default_config()
+    for index in range(trajectory.total_frames()):
+        state = trajectory.frame_array(index)
+        frame_count = index + 1
+        pos = state[:, :2].astype(float)
+        events = frame_events(frame_count, pos, config) if collisions else ()
+        pipeline.publish(frame_count, state, events)
+
+
+def write_story(story, output_dir):
+    """
+    Writes the story JSON and text of a finished StoryMapper, or only
+    returns their paths when it streamed them.
+    """
+    if story.sink is not None:
+        return story.sink.json_file, story.sink.story_file
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    json_file = output_dir / "story_output.json"
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(story.generate_story_json(), f, indent=2)
+
+    story_file = output_dir / "story.txt"
+    with open(story_file, "w", encoding="utf-8") as f:
+        for line in story.generate_story_text():
+            f.write(line + "\n")
+
+    return json_file, story_file
+
+
+def story_mapper(total_frames, num_agents, output_dir, stream=False, top_k=None, window=300):
+    """
+    A StoryMapper for a run of total_frames. With stream it narrates into
+    story_output.jsonl and story.txt in output_dir as the run goes, and
+    keeps no events. With top_k it tells only the top_k strongest events
+    of every window frames.
+    """
+    sink = StoryStreamWriter(output_dir) if stream else None
+    aggregator = StoryAggregator(window, top_k) if top_k else None
+    return StoryMapper(total_frames=total_frames, num_agents=num_agents, sink=sink,
+                       aggregator=aggregator)
+
+
+def render(config, num_frames, seed, output_dir, backend="agents", trajectory=None,
+           stream=False, top_k=None, window=300):
+    """
+    Simulates one run and streams its events into a StoryMapper, then
+    writes story_output.json and story.txt to output_dir, and a trajectory
+    file if a path is given. With stream the story is written while the
+    run goes, the events as JSON Lines to story_output.jsonl. With top_k
+    only the top_k strongest events of every window frames are told.
+    Returns a summary dict with the output files and timings.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    # frames are numbered from 1, so the run spans num_frames + 1
+    story = story_mapper(num_frames + 1, config.num_agents, output_dir, stream, top_k, window)
+    pipeline = FramePipeline([story])
+    files = {}
+    if trajectory:
+        pipeline.subscribe(TrajectoryWriter(trajectory, config.num_agents, seed))
+        files["trajectory"] = str(trajectory)
+
+    elapsed, published = simulate(pipeline, config, num_frames, seed, backend)
+    pipeline.close()
+    json_file, story_file = write_story(story, output_dir)
+    files["story_json"] = str(json_file)
+    files["story_text"] = str(story_file)
+
+    return {
+        "seed": seed,
+        "agents": config.num_agents,
+        "frames": num_frames,
+        "story_events": story.event_count,
+        "story_events_told": story.told_count,
+        "simulation_seconds": elapsed,
+        "publish_seconds": published,
+        "total_seconds": time.perf_counter() - start,
+        "frames_per_sec": num_frames / elapsed if elapsed > 0 else None,
+        "files": files,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a swarm story without a display.")
+    parser.add_argument("--agents", type=int, default=default_config().num_agents)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output-dir", default=Path(__file__).parent / "outputs")
+    parser.add_argument("--engine", choices=("agents", "arrays"), default="agents")
+    parser.add_argument("--synchronous", action="store_true")
+    parser.add_argument("--trajectory", help="also write the run to this trajectory file")
+    parser.add_argument("--replay", help="skip simulation and render this trajectory file")
+    parser.add_argument("--stream", action="store_true",
+                        help="write the story while it happens, events as JSON Lines")
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="tell only this many of the strongest events per window")
+    parser.add_argument("--window", type=int, default=300, help="frames per --top-k window")
+    parser.add_argument("--width", type=float, default=default_config().width,
+                        help="world width; a replay needs the recorded run's")
+    parser.add_argument("--height", type=float, default=default_config().height,
+                        help="world height; a replay needs the recorded run's")
+    args = parser.parse_args()
+
+    config = replace(
+        default_config(),
+        num_agents=args.agents,
+        width=args.width,
+        height=args.height,
+        synchronous=args.synchronous or default_config().synchronous
+    )
+
+    if args.replay:
+        random.seed(args.seed)
+        trajectory = TrajectoryReader(args.replay)
+        story = story_mapper(trajectory.total_frames() + 1, trajectory.num_agents,
+                             args.output_dir, args.stream, args.top_k, args.window)
+        pipeline = FramePipeline([story])
+        replay(pipeline, trajectory, config)
+        pipeline.close()
+        json_file, story_file = write_story(story, args.output_dir)
+        print(f"Replayed {trajectory.total_frames()} frames of {trajectory.num_agents} agents")
+        print(f"📦 {json_file} generated")
+        print(f"📖 {story_file} generated")
+        return
+
+    result = render(config, args.frames, args.seed, args.output_dir,
+                    backend=args.engine, trajectory=args.trajectory, stream=args.stream,
+                    top_k=args.top_k, window=args.window)
+
+    print(f"Simulated {args.frames} frames of {args.agents} agents "
+          f"in {result['simulation_seconds']:.2f}s ({result['frames_per_sec'] or 0:.1f} frames/sec), "
+          f"published in {result['publish_seconds']:.2f}s")
+    print("Story events:", result["story_events"], f"({result['story_events_told']} told)")
+    print(f"📦 {result['files']['story_json']} generated")
+    print(f"📖 {result['files']['story_text']} generated")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 import pygame
-from engine import Agent, WIDTH, HEIGHT, NUM_AGENTS
-from data_layer import SwarmStateBuffer, EventLogger
+from itertools import islice
+from engine import (
+    Agent, SpatialHash, step_agents, collision_pairs, positions, proximity_groups,
+    WIDTH, HEIGHT, NUM_AGENTS
+)
+from data_layer import ColumnarSwarmStateBuffer, StructuredEventLogger, FrameEvents
+from story_mapper import StoryMapper, StoryStreamWriter
 from pathlib import Path
 
 pygame.init()
@@ -10,12 +15,29 @@ pygame.display.set_caption("Swarm Intelligence Engine")
 clock = pygame.time.Clock()
 
 # ---------------- Data Layer Initialization ----------------
-swarm_buffer = SwarmStateBuffer()
-event_logger = EventLogger()
+swarm_buffer = ColumnarSwarmStateBuffer()
+event_logger = StructuredEventLogger()
 frame_count = 0
 
+# ---------------- Live Story ----------------
+# With STORY_STREAM the story is narrated while the swarm runs, into
+# story/outputs/story_output.jsonl and story.txt, keeping no frames or
+# events. Phases need the run length up front, so they follow
+# STORY_FRAMES, the expected number of frames (60 per second).
+STORY_STREAM = False
+STORY_FRAMES = 60 * 60 * 10
+
+live_story = None
+if STORY_STREAM:
+    live_story = StoryMapper(
+        total_frames=STORY_FRAMES,
+        num_agents=NUM_AGENTS,
+        sink=StoryStreamWriter(Path(__file__).parent / "outputs")
+    )
+
 # ---------------- Agents ----------------
 agents = [Agent() for _ in range(NUM_AGENTS)]
+grid = SpatialHash()
 
 running = True
 while running:
@@ -28,11 +50,10 @@ while running:
 
     screen.fill((0, 0, 0))  # black background
 
-    for agent in agents:
-        agent.apply_behaviors(agents)
-        agent.update()
-        agent.edges()
+    grid.rebuild(agents)
+    step_agents(agents, grid)
 
+    for agent in agents:
         # draw agent
         pygame.draw.circle(
             screen,
@@ -42,13 +63,24 @@ while running:
         )
 
     # ---------------- Log Data Layer ----------------
-    swarm_buffer.log_frame(agents)
+    pos = positions(agents)
+    pairs = collision_pairs(pos)
+    groups = proximity_groups(pos)
+
+    if live_story is not None:
+        # narrate this frame now instead of logging it
+        live_story.on_frame(frame_count, None, FrameEvents(
+            frame_count, {"collision": pairs}, {"proximity": groups}
+        ))
+    else:
+        # the story reads the logs after the run, so they keep every frame
+        swarm_buffer.log_frame(agents)
+
+        # log collisions if agents get too close
+        event_logger.log_events_bulk(frame_count, "collision", pairs)
 
-    # Example: log collisions if agents get too close
-    for i, a1 in enumerate(agents):
-        for j, a2 in enumerate(agents[i+1:], start=i+1):
-            if a1.pos.distance_to(a2.pos) < 5:  # collision threshold
-                event_logger.log_event(frame_count, "collision", {"agents": (i, j)})
+        # log groups of 3+ agents staying close (alliance candidates)
+        event_logger.log_groups_bulk(frame_count, "proximity", groups)
 
     # -------------------------------------------------
 
@@ -57,8 +89,11 @@ while running:
 pygame.quit()
 
 # ---------------- Optional: Save / inspect logged data ----------------
-print("Total frames logged:", swarm_buffer.total_frames())
-print("Sample events logged:", event_logger.get_events()[:5])  # print first 5 events
+if live_story is None:
+    print("Total frames logged:", swarm_buffer.total_frames())
+    print("Sample events logged:", list(islice(event_logger, 5)))  # print first 5 events
+else:
+    print("Total frames narrated:", frame_count)
 
 # from music_mapper import SwarmMusicMapper
 
@@ -71,72 +106,68 @@ print("Sample events logged:", event_logger.get_events()[:5])  # print first 5 e
 # print("🎼 swarm_music.mid generated")
 
 
-from story_mapper import StoryMapper
-import json
-
-# --------------------------------
-# Initialize story system (neutral only)
-# --------------------------------
-story = StoryMapper()
-
-# --------------------------------
-# Get all logged swarm events
-# --------------------------------
-events = event_logger.get_events()
-
-# Safety check
-if events:
-    total_frames = max(e["frame"] for e in events) + 1
+if live_story is not None:
+    live_story.close()
+    print("📦 story_output.jsonl and 📖 story.txt streamed to story/outputs/")
 else:
-    total_frames = 0
-
-# --------------------------------
-# Feed swarm events into story layer
-# --------------------------------
-for event in events:
-    story.process_event(event, total_frames)
-
-# --------------------------------
-# OVERWRITE JSON every run
-# --------------------------------
-story_data = story.generate_story_json()
-
-# --------------------------------
-# Resolve output path safely
-# --------------------------------
-BASE_DIR = Path(__file__).parent          # story/
-OUTPUT_DIR = BASE_DIR / "outputs"         # story/outputs/
-OUTPUT_DIR.mkdir(exist_ok=True)
-
-# --------------------------------
-# Write JSON output
-# --------------------------------
-json_file = OUTPUT_DIR / "story_output.json"
-
-with open(json_file, "w", encoding="utf-8") as f:
-    json.dump(story_data, f, indent=2)
-
-print("📦 story_output.json generated in story/outputs/")
-
-# --------------------------------
-# Generate neutral narrative text
-# --------------------------------
-story_lines = story.generate_story_text()
-
-# --------------------------------
-# Resolve output path safely
-# --------------------------------
-BASE_DIR = Path(__file__).parent          # story/
-OUTPUT_DIR = BASE_DIR / "outputs"         # story/outputs/
-OUTPUT_DIR.mkdir(exist_ok=True)
-
-# --------------------------------
-# Write story file
-# --------------------------------
-story_file = OUTPUT_DIR / "story.txt"
-
-with open(story_file, "w", encoding="utf-8") as f:
-    for line in story_lines:
-        f.write(line + "\n")
-
-print("📖 story.txt generated in story/outputs/")
+    import json
+
+    # --------------------------------
+    # Initialize story system (neutral only)
+    # --------------------------------
+    story = StoryMapper(num_agents=NUM_AGENTS)
+
+    # --------------------------------
+    # Story length from the logged swarm events (0 if none)
+    # --------------------------------
+    total_frames = event_logger.max_frame() + 1
+
+    # --------------------------------
+    # Feed swarm events into story layer
+    # --------------------------------
+    story.process_records(event_logger, total_frames)
+
+    # --------------------------------
+    # OVERWRITE JSON every run
+    # --------------------------------
+    story_data = story.generate_story_json()
+
+    # --------------------------------
+    # Resolve output path safely
+    # --------------------------------
+    BASE_DIR = Path(__file__).parent          # story/
+    OUTPUT_DIR = BASE_DIR / "outputs"         # story/outputs/
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    # --------------------------------
+    # Write JSON output
+    # --------------------------------
+    json_file = OUTPUT_DIR / "story_output.json"
+
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(story_data, f, indent=2)
+
+    print("📦 story_output.json generated in story/outputs/")
+
+    # --------------------------------
+    # Generate neutral narrative text
+    # --------------------------------
+    story_lines = story.generate_story_text()
+
+    # --------------------------------
+    # Resolve output path safely
+    # --------------------------------
+    BASE_DIR = Path(__file__).parent          # story/
+    OUTPUT_DIR = BASE_DIR / "outputs"         # story/outputs/
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    # --------------------------------
+    # Write story file
+    # --------------------------------
+    story_file = OUTPUT_DIR / "story.txt"
+
+    with open(story_file, "w", encoding="utf-8") as f:
+        for line in story_lines:
+            f.write(line + "\n")
+
+    print("📖 story.txt generated in story/outputs/")
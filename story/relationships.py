@@ -0,0 +1,198 @@
+# relationships.py
+# ---------------- Relationship Store ----------------
+# Collision counts for every pair of agents that has met. Small swarms keep
+# a dense upper-triangular int32 array (one slot per possible pair); large
+# ones keep only the pairs that met, as sorted int64 pair keys with their
+# counts, and collect new pairs in a small sorted delta that is merged in
+# when it grows. A frame's collision pairs are counted in one call, and
+# the top pairs and per-agent summaries are array queries.
+
+import numpy as np
+
+DENSE_PAIRS = 1 << 23  # largest triangle kept dense: 32 MiB of int32, ~4096 agents
+PAIR_SHIFT = 32        # pair key = i << PAIR_SHIFT | j, with i < j
+
+
+def pair_keys(i, j):
+    return (np.asarray(i, dtype=np.int64) << PAIR_SHIFT) | np.asarray(j, dtype=np.int64)
+
+
+def occurrence(keys):
+    """How many times each key already appeared earlier in keys (0, 1, ...)."""
+    order = np.argsort(keys, kind='stable')
+    ranked = keys[order]
+    first = np.concatenate(([True], ranked[1:] != ranked[:-1])) if len(keys) else np.empty(0, bool)
+    starts = np.maximum.accumulate(np.where(first, np.arange(len(keys)), 0))
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[order] = np.arange(len(keys)) - starts
+    return rank
+
+
+class RelationshipStore:
+    """
+    Collision count of every agent pair. Dense when num_agents is given and
+    its triangle fits in DENSE_PAIRS; sparse otherwise, or as soon as an
+    agent index beyond num_agents shows up.
+    """
+    def __init__(self, num_agents=None, merge_min=4096):
+        self.num_agents = num_agents
+        self.merge_min = merge_min
+        if num_agents is not None and num_agents * (num_agents - 1) // 2 <= DENSE_PAIRS:
+            self.dense = np.zeros(num_agents * (num_agents - 1) // 2, dtype=np.int32)
+        else:
+            self.dense = None
+        self.keys = np.empty(0, dtype=np.int64)   # sorted pair keys
+        self.counts = np.empty(0, dtype=np.int32)
+        self.delta_keys = np.empty(0, dtype=np.int64)  # sorted, not in keys
+        self.delta_counts = np.empty(0, dtype=np.int32)
+
+    # ---------------- LAYOUT ----------------
+
+    def _slots(self, i, j):
+        # row i of the triangle holds pairs (i, i+1) .. (i, n-1)
+        n = self.num_agents
+        return i * (2 * n - i - 1) // 2 + (j - i - 1)
+
+    def _to_sparse(self):
+        i, j, counts = self.pairs()
+        self.keys = pair_keys(i, j)
+        self.counts = counts.astype(np.int32)
+        self.dense = None
+
+    def _merge(self):
+        at = np.searchsorted(self.keys, self.delta_keys)
+        self.keys = np.insert(self.keys, at, self.delta_keys)
+        self.counts = np.insert(self.counts, at, self.delta_counts)
+        self.delta_keys = np.empty(0, dtype=np.int64)
+        self.delta_counts = np.empty(0, dtype=np.int32)
+
+    @staticmethod
+    def _find(keys, wanted):
+        """Positions of wanted in sorted keys, and which were found."""
+        at = np.minimum(np.searchsorted(keys, wanted), max(len(keys) - 1, 0))
+        found = keys[at] == wanted if len(keys) else np.zeros(len(wanted), dtype=bool)
+        return at, found
+
+    # ---------------- UPDATE ----------------
+
+    def increment_bulk(self, pairs):
+        """
+        Counts one collision for every (i, j) row of pairs, in either order.
+        Returns the count each pair reached with that collision, so a pair
+        listed twice gets two successive counts. An agent paired with
+        itself raises ValueError.
+        """
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        if not len(pairs):
+            return np.empty(0, dtype=np.int64)
+        i, j = pairs.min(axis=1), pairs.max(axis=1)
+        if (i == j).any():
+            raise ValueError(f"agent {int(i[i == j][0])} paired with itself")
+        if self.dense is not None and j.max() >= self.num_agents:
+            self._to_sparse()
+
+        if self.dense is not None:
+            slots = self._slots(i, j)
+            rank = occurrence(slots)
+            before = self.dense[slots].astype(np.int64)
+            np.add.at(self.dense, slots, 1)
+            return before + rank + 1
+
+        keys = pair_keys(i, j)
+        rank = occurrence(keys)
+        before = np.zeros(len(keys), dtype=np.int64)
+
+        at, found = self._find(self.keys, keys)
+        before[found] = self.counts[at[found]]
+        np.add.at(self.counts, at[found], 1)
+
+        rest = ~found
+        d_at, d_found = self._find(self.delta_keys, keys[rest])
+        before[np.flatnonzero(rest)[d_found]] = self.delta_counts[d_at[d_found]]
+        np.add.at(self.delta_counts, d_at[d_found], 1)
+
+        new, new_counts = np.unique(keys[rest][~d_found], return_counts=True)
+        if len(new):
+            at = np.searchsorted(self.delta_keys, new)
+            self.delta_keys = np.insert(self.delta_keys, at, new)
+            self.delta_counts = np.insert(self.delta_counts, at, new_counts.astype(np.int32))
+            if len(self.delta_keys) > max(self.merge_min, len(self.keys) // 8):
+                self._merge()
+        return before + rank + 1
+
+    # ---------------- QUERIES ----------------
+
+    def __len__(self):
+        """Number of pairs that have met."""
+        if self.dense is not None:
+            return int(np.count_nonzero(self.dense))
+        return len(self.keys) + len(self.delta_keys)
+
+    def __getitem__(self, pair):
+        i, j = sorted(pair)
+        if i == j:
+            return 0
+        if self.dense is not None:
+            return int(self.dense[self._slots(i, j)]) if j < self.num_agents else 0
+        key = int(pair_keys(i, j))
+        for keys, counts in ((self.keys, self.counts), (self.delta_keys, self.delta_counts)):
+            at = np.searchsorted(keys, key)
+            if at < len(keys) and keys[at] == key:
+                return int(counts[at])
+        return 0
+
+    @property
+    def nbytes(self):
+        arrays = (self.keys, self.counts, self.delta_keys, self.delta_counts)
+        return sum(a.nbytes for a in arrays) + (self.dense.nbytes if self.dense is not None else 0)
+
+    def pairs(self):
+        """(i, j, count) arrays of every pair that has met, in pair order."""
+        if self.dense is not None:
+            slots = np.flatnonzero(self.dense)
+            n = self.num_agents
+            # invert _slots: row i starts at i * (2n - i - 1) / 2
+            starts = np.arange(n) * (2 * n - np.arange(n) - 1) // 2
+            i = np.searchsorted(starts, slots, side='right') - 1
+            j = slots - starts[i] + i + 1
+            return i, j, self.dense[slots].astype(np.int64)
+        if len(self.delta_keys):
+            self._merge()
+        mask = (1 << PAIR_SHIFT) - 1
+        return self.keys >> PAIR_SHIFT, self.keys & mask, self.counts.astype(np.int64)
+
+    def top(self, k=10, min_count=1):
+        """(i, j, count) arrays of the k pairs that met most, most first."""
+        i, j, counts = self.pairs()
+        keep = counts >= min_count
+        i, j, counts = i[keep], j[keep], counts[keep]
+        if len(counts) > k:
+            best = np.argpartition(-counts, k - 1)[:k]
+            i, j, counts = i[best], j[best], counts[best]
+        order = np.lexsort((j, i, -counts))
+        return i[order], j[order], counts[order]
+
+    def partners(self, agent):
+        """(other agent, count) arrays of everyone agent has met."""
+        i, j, counts = self.pairs()
+        mine = (i == agent) | (j == agent)
+        return np.where(i[mine] == agent, j[mine], i[mine]), counts[mine]
+
+    def summary(self, num_agents=None, rivalry=4):
+        """
+        Per-agent arrays: 'partners' met, total 'encounters', 'strongest'
+        single pair count, and 'rivals', partners met at least rivalry times.
+        """
+        i, j, counts = self.pairs()
+        # agents seen beyond num_agents (the store went sparse) still get a slot
+        n = max(num_agents or self.num_agents or 0, int(max(i.max(), j.max())) + 1 if len(i) else 0)
+        both = np.concatenate((i, j))
+        twice = np.concatenate((counts, counts))
+        strongest = np.zeros(n, dtype=np.int64)
+        np.maximum.at(strongest, both, twice)
+        return {
+            "partners": np.bincount(both, minlength=n),
+            "encounters": np.bincount(both, weights=twice, minlength=n).astype(np.int64),
+            "strongest": strongest,
+            "rivals": np.bincount(both[twice >= rivalry], minlength=n),
+        }
@@ -1,5 +1,14 @@
-from collections import defaultdict
+import heapq
+import json
 import random
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from data_layer import FrameEvents
+from engine import ClusterTracker
+from relationships import RelationshipStore
 
 # ---------------------------
 # Agent Names
@@ -16,16 +25,30 @@ AGENT_NAMES_LIST = [
 NUM_AGENTS = 60  
 AGENT_NAMES = {i: AGENT_NAMES_LIST[i % len(AGENT_NAMES_LIST)] for i in range(NUM_AGENTS)}
 
+
+def agent_name(i):
+    # names repeat for swarms larger than NUM_AGENTS
+    return AGENT_NAMES_LIST[i % len(AGENT_NAMES_LIST)]
+
 # ---------------------------
 # Story Mapper
 # ---------------------------
 class StoryMapper:
-    def __init__(self):
-        self.story_events = []
-        self.relationships = defaultdict(int)
-        self.proximity_tracker = defaultdict(int)
-        self.last_seen_frame = {}
-        self.formed_alliances = set()
+    def __init__(self, total_frames=None, alliance_idle=2, alliance_overlap=0.5,
+                 num_agents=None, sink=None, aggregator=None):
+        self.total_frames = total_frames  # run length, needed when streaming
+        self.story_events = []  # kept only without a sink
+        self.sink = sink  # e.g. StoryStreamWriter: takes events as they happen
+        self.aggregator = aggregator  # e.g. StoryAggregator: keeps the strongest
+        self.event_count = 0  # every event, told or not
+        self.told_count = 0
+        self.relationships = RelationshipStore(num_agents)  # collisions per pair
+        self.RIVALRY_THRESHOLD = 4  # collisions for a rivalry
+        # proximity groups keep their identity while members come and go;
+        # a group apart for more than alliance_idle frames is forgotten
+        self.group_tracker = ClusterTracker(alliance_overlap, alliance_idle)
+        self.pending_groups = []  # (frame, phase, group) of the frame being read
+        self.formed_alliances = set()  # tracker ids
         self.ALLIANCE_THRESHOLD = 20  # frames for alliance formation
 
     # Determine story phase
@@ -39,143 +62,412 @@ class StoryMapper:
 
     # Process events
     def process_event(self, event, total_frames):
-        frame = event.get("frame")
-        etype = event.get("type")
-        agents = event.get("info", {}).get("agents", [])
+        self.process(
+            event.get("frame"),
+            event.get("type"),
+            event.get("info", {}).get("agents", []),
+            total_frames
+        )
 
+    # Process EventRecords from StructuredEventLogger, without dict lookups;
+    # each frame's run of collisions is counted in one bulk update
+    def process_records(self, records, total_frames):
+        pairs, pairs_frame = [], None
+        for frame, etype, agents in records:
+            if etype == "collision" and len(agents) == 2:
+                if pairs and frame != pairs_frame:
+                    self.process_collisions(pairs_frame, pairs, total_frames)
+                    pairs = []
+                pairs_frame = frame
+                pairs.append(agents)
+                continue
+            if pairs:
+                self.process_collisions(pairs_frame, pairs, total_frames)
+                pairs = []
+            self.process(frame, etype, agents, total_frames)
+        if pairs:
+            self.process_collisions(pairs_frame, pairs, total_frames)
+        self.flush_groups()
+
+    # Process one frame's FrameEvents straight from its pair arrays
+    def process_frame(self, events, total_frames):
+        for etype, pairs in events.pairs.items():
+            if etype == "collision" and len(pairs):
+                self.process_collisions(events.frame, pairs, total_frames)
+        for etype, groups in events.groups.items():
+            for group in groups:
+                self.process(events.frame, etype, tuple(group), total_frames)
+        self.flush_groups()
+
+    # FramePipeline subscriber: narrates events as they are simulated
+    def on_frame(self, frame_number, frame, events):
+        if isinstance(events, FrameEvents):
+            self.process_frame(events, self.total_frames)
+        else:
+            self.process_records(events, self.total_frames)
+        if self.sink is not None:
+            self.sink.flush()
+
+    def close(self):
+        self.finish()
+        if self.sink is not None:
+            self.sink.close()
+
+    def finish(self):
+        """Narrates everything still buffered once the events are done."""
+        self.flush_groups()
+        if self.aggregator is not None:
+            for event in self.aggregator.finish():
+                self._deliver(event)
+
+    def _emit(self, event):
+        self.event_count += 1
+        if self.aggregator is None:
+            self._deliver(event)
+        else:
+            for kept in self.aggregator.add(event):
+                self._deliver(kept)
+
+    def _deliver(self, event):
+        self.told_count += 1
+        if self.sink is not None:
+            self.sink.write_event(event)
+        else:
+            self.story_events.append(event)
+
+    def process(self, frame, etype, agents, total_frames):
+        self._begin_frame(frame)
         phase = self._get_phase(frame, total_frames)
 
-        # ---- Collisions: Tension → Conflict → Rivalry ----
         if etype == "collision" and len(agents) == 2:
-            pair = tuple(sorted(agents))
-            self.relationships[pair] += 1
-            count = self.relationships[pair]
-
-            if count == 1:
-                story_type = "tension"
-            elif count < 4:
-                story_type = "conflict"
-            else:
-                story_type = "rivalry"
-
-            self.story_events.append({
+            self.process_collisions(frame, [agents], total_frames)
+
+        # ---- Proximity: Alliance ----
+        # a frame's groups arrive one event each; they are matched together
+        if etype == "proximity" and len(agents) >= 3:
+            self.pending_groups.append((frame, phase, tuple(sorted(agents))))
+
+    def _begin_frame(self, frame):
+        if self.pending_groups and frame != self.pending_groups[0][0]:
+            self.flush_groups()
+
+    # ---- Collisions: Tension → Conflict → Rivalry ----
+    def process_collisions(self, frame, pairs, total_frames):
+        """Narrates one frame's collisions, given as agent pairs."""
+        self._begin_frame(frame)
+        phase = self._get_phase(frame, total_frames)
+        pairs = np.sort(np.asarray(pairs, dtype=np.int64).reshape(-1, 2), axis=1)
+        counts = self.relationships.increment_bulk(pairs)
+        story_types = np.where(
+            counts == 1, "tension",
+            np.where(counts < self.RIVALRY_THRESHOLD, "conflict", "rivalry")
+        )
+
+        if self.aggregator is not None:
+            # only events that could make the summary become dicts
+            for event in self.aggregator.advance(frame, phase):
+                self._deliver(event)
+            keep = self.aggregator.candidates(
+                frame, phase, counts,
+                lambda i: (tuple(pairs[i].tolist()), str(story_types[i]))
+            )
+            self.event_count += len(pairs) - len(keep)
+            pairs, counts, story_types = pairs[keep], counts[keep], story_types[keep]
+
+        for pair, count, story_type in zip(pairs.tolist(), counts.tolist(), story_types.tolist()):
+            self._emit({
                 "frame": frame,
                 "event_type": "collision",
-                "agents": pair,
+                "agents": tuple(pair),
                 "story_type": story_type,
                 "phase": phase,
                 "intensity": count
             })
 
-        # ---- Proximity: Alliance ----
-        if etype == "proximity" and len(agents) >= 3:
-            group = tuple(sorted(agents))
-            last_frame = self.last_seen_frame.get(group, -1)
-
-            if frame != last_frame + 1:
-                self.proximity_tracker[group] = 1
-            else:
-                self.proximity_tracker[group] += 1
-
-            self.last_seen_frame[group] = frame
-
-            if self.proximity_tracker[group] >= self.ALLIANCE_THRESHOLD and group not in self.formed_alliances:
-                self.formed_alliances.add(group)
-                self.story_events.append({
+    def flush_groups(self):
+        """
+        Tracks the buffered proximity groups of one frame, and narrates an
+        alliance when a group has stayed together for ALLIANCE_THRESHOLD
+        frames. Called when the next frame's events begin, and at the end.
+        """
+        if not self.pending_groups:
+            return
+        frame = self.pending_groups[0][0]
+        groups = [group for _, _, group in self.pending_groups]
+        ids = self.group_tracker.update(groups, frame)
+        # alliances of evicted groups are done; a new one may form later
+        self.formed_alliances.intersection_update(self.group_tracker.members)
+
+        for (_, phase, group), track in zip(self.pending_groups, ids):
+            streak = self.group_tracker.streak[track]
+            if streak >= self.ALLIANCE_THRESHOLD and track not in self.formed_alliances:
+                self.formed_alliances.add(track)
+                self._emit({
                     "frame": frame,
                     "event_type": "group_merge",
                     "agents": group,
                     "story_type": "alliance",
                     "phase": phase,
-                    "intensity": self.proximity_tracker[group]
+                    "intensity": streak
                 })
+        self.pending_groups = []
 
     # JSON output
     def generate_story_json(self):
+        self.finish()
         return {"story_events": self.story_events}
 
     # Textual narrative
     def generate_story_text(self):
-        if not self.story_events:
-            return ["The swarm moved in silence, with no notable interactions."]
-
-        story = ["📖 Swarm Narrative\n"]
-        current_phase = None
-        seen_pairs = set()  # track (pair/group, story_type) globally
-
-        # Optional narrative phrases for variation
-        conflict_phrases = [
-            "erupted into repeated confrontations",
-            "clashed multiple times",
-            "had escalating tensions",
-            "engaged in a fierce standoff",
-        ]
-        rivalry_phrases = [
-            "escalated into a lasting rivalry",
-            "became a defining force within the swarm",
-            "remained in conflict throughout the simulation",
-        ]
-        alliance_phrases = [
-            "formed a strategic alliance",
-            "stayed close long enough to coordinate",
-            "banded together for mutual benefit",
-        ]
-
+        self.finish()
+        narrator = Narrator()
+        story = []
         for e in self.story_events:
-            phase = e["phase"]
-            agents = e["agents"]
-            stype = e["story_type"]
-
-            # Phase header
-            if phase != current_phase:
-                if phase == "introduction":
-                    story.append("\n🌱 INTRODUCTION\n")
-                    story.append("At the beginning of the simulation, the swarm drifted calmly, its agents unaware of the tensions that would soon emerge.")
-                elif phase == "rising_conflict":
-                    story.append("\n⚡ RISING CONFLICT\n")
-                    story.append("As time passed, repeated encounters shaped relationships, and subtle tensions grew into open confrontations.")
-                elif phase == "climax":
-                    story.append("\n🔥 CLIMAX\n")
-                    story.append("In the final moments, unresolved conflicts surfaced, defining the fate of the swarm.")
-                current_phase = phase
-
-            # Skip duplicates
-            key = (tuple(agents), stype)
-            if key in seen_pairs:
-                continue
-            seen_pairs.add(key)
-
-            # Map agent numbers to names
-            names = [AGENT_NAMES[a] for a in agents]
-
-            # Generate narrative line
-            if stype == "tension":
-                line = f"Agents {names[0]} and {names[1]} crossed paths, sensing unease for the first time."
-            elif stype == "conflict":
-                phrase = random.choice(conflict_phrases)
-                line = f"Agents {names[0]} and {names[1]} {phrase}."
-            elif stype == "rivalry":
-                phrase = random.choice(rivalry_phrases)
-                line = f"Agents {names[0]} and {names[1]} {phrase}."
-            elif stype == "alliance":
-                phrase = random.choice(alliance_phrases)
-                line = f"Agents {', '.join(names)} {phrase}."
-            else:
-                line = f"Agents {', '.join(names)} interacted."
-
-            story.append(line)
-
-        # Epilogue
-        story.append(
-            "\n🧠 Epilogue:\n"
-            "Though governed by simple rules, the swarm revealed complex relationships—a reminder that stories can emerge even from mathematics."
-        )
-
+            story.extend(narrator.feed(e))
+        story.extend(narrator.epilogue())
         return story
 
 
+# ---------------------------
+# Aggregation
+# ---------------------------
+class RecentCounter:
+    """
+    Counts keys, remembering at most capacity of them: the key used least
+    recently is forgotten first, and counts from 0 again if it returns.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = OrderedDict()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, key):
+        return key in self.counts
+
+    def get(self, key):
+        return self.counts.get(key, 0)
+
+    def add(self, key):
+        """Counts key once more and returns its count."""
+        count = self.counts.pop(key, 0) + 1
+        self.counts[key] = count
+        if len(self.counts) > self.capacity:
+            self.counts.popitem(last=False)
+        return count
+
+
+class StoryAggregator:
+    """
+    Keeps a story readable however large the swarm: events are bucketed
+    by phase and window of frames, and only the top_k of each bucket are
+    told, in frame order. An event scores its intensity times its novelty,
+    1 / (1 + times its agents and story type were told before), and a
+    bucket keeps its best event per key. Memory is top_k events plus the
+    told counts of the last memory keys.
+    """
+    def __init__(self, window=300, top_k=5, memory=65536):
+        self.window = window
+        self.top_k = top_k
+        self.told = RecentCounter(memory)
+        self.bucket = None
+        self.heap = []  # (score, -order, key, event), the weakest on top
+        self.order = 0
+
+    def score(self, event, key):
+        return event["intensity"] / (1 + self.told.get(key))
+
+    def advance(self, frame, phase):
+        """Moves to the bucket of frame; returns the events of one it closed."""
+        bucket = (phase, frame // self.window)
+        released = self.finish() if bucket != self.bucket else []
+        self.bucket = bucket
+        return released
+
+    def candidates(self, frame, phase, intensities, key_of):
+        """
+        Indices, in order, of the events of one frame that could still be
+        told, from their intensities alone; key_of(i) is event i's key.
+        Call advance() for the frame first, so novelty is up to date. A
+        score never exceeds its intensity, so events are looked at
+        strongest first until top_k distinct keys of this frame, or the
+        bucket's weakest kept event, already beat the rest.
+        """
+        floor = self.heap[0][0] if len(self.heap) >= self.top_k else None
+
+        order = np.argsort(-intensities, kind='stable')
+        if floor is not None:
+            order = order[intensities[order] > floor]
+        best = {}  # key -> (score, -index)
+        kth = None
+        for i in order.tolist():
+            if kth is not None and intensities[i] < kth:
+                break
+            key = key_of(i)
+            entry = (intensities[i] / (1 + self.told.get(key)), -i)
+            if key not in best or entry > best[key]:
+                best[key] = entry
+                if len(best) >= self.top_k:
+                    kth = sorted(best.values(), reverse=True)[self.top_k - 1][0]
+        kept = sorted(best.values(), reverse=True)[:self.top_k]
+        return sorted(-index for _, index in kept)
+
+    def add(self, event):
+        """Takes one event; returns the events of a bucket it closed."""
+        released = self.advance(event["frame"], event["phase"])
+
+        key = (tuple(event["agents"]), event["story_type"])
+        entry = (self.score(event, key), -self.order, key, event)
+        self.order += 1
+
+        same = [i for i, kept in enumerate(self.heap) if kept[2] == key]
+        if same:
+            # one beat per key and bucket: keep the stronger telling
+            if entry[:2] > self.heap[same[0]][:2]:
+                self.heap[same[0]] = entry
+                heapq.heapify(self.heap)
+        elif len(self.heap) < self.top_k:
+            heapq.heappush(self.heap, entry)
+        elif entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+        return released
+
+    def finish(self):
+        """Closes the current bucket; returns its kept events in order."""
+        kept = sorted(self.heap, key=lambda entry: -entry[1])
+        self.heap = []
+        for _, _, key, _ in kept:
+            self.told.add(key)
+        return [event for _, _, _, event in kept]
+
 
+# ---------------------------
+# Narrator
+# ---------------------------
+class Narrator:
+    """
+    Turns story events into narrative lines one event at a time, so a
+    story can be written while it happens: feed() returns the lines an
+    event adds (a phase header, then its line unless already told), and
+    epilogue() the closing lines once the events are done. Only the last
+    memory pairs and groups told are remembered, so in a story with more
+    than that many, one forgotten long ago may be told again.
+    """
+    # Optional narrative phrases for variation
+    conflict_phrases = [
+        "erupted into repeated confrontations",
+        "clashed multiple times",
+        "had escalating tensions",
+        "engaged in a fierce standoff",
+    ]
+    rivalry_phrases = [
+        "escalated into a lasting rivalry",
+        "became a defining force within the swarm",
+        "remained in conflict throughout the simulation",
+    ]
+    alliance_phrases = [
+        "formed a strategic alliance",
+        "stayed close long enough to coordinate",
+        "banded together for mutual benefit",
+    ]
+
+    def __init__(self, memory=65536):
+        self.started = False
+        self.current_phase = None
+        # track (pair/group, story_type), forgetting the longest untold
+        self.seen_pairs = RecentCounter(memory)
+
+    def feed(self, e):
+        story = []
+        if not self.started:
+            story.append("📖 Swarm Narrative\n")
+            self.started = True
+
+        phase = e["phase"]
+        agents = e["agents"]
+        stype = e["story_type"]
+
+        # Phase header
+        if phase != self.current_phase:
+            if phase == "introduction":
+                story.append("\n🌱 INTRODUCTION\n")
+                story.append("At the beginning of the simulation, the swarm drifted calmly, its agents unaware of the tensions that would soon emerge.")
+            elif phase == "rising_conflict":
+                story.append("\n⚡ RISING CONFLICT\n")
+                story.append("As time passed, repeated encounters shaped relationships, and subtle tensions grew into open confrontations.")
+            elif phase == "climax":
+                story.append("\n🔥 CLIMAX\n")
+                story.append("In the final moments, unresolved conflicts surfaced, defining the fate of the swarm.")
+            self.current_phase = phase
+
+        # Skip duplicates
+        key = (tuple(agents), stype)
+        if self.seen_pairs.add(key) > 1:
+            return story
+
+        # Map agent numbers to names
+        names = [agent_name(a) for a in agents]
+
+        # Generate narrative line
+        if stype == "tension":
+            line = f"Agents {names[0]} and {names[1]} crossed paths, sensing unease for the first time."
+        elif stype == "conflict":
+            phrase = random.choice(self.conflict_phrases)
+            line = f"Agents {names[0]} and {names[1]} {phrase}."
+        elif stype == "rivalry":
+            phrase = random.choice(self.rivalry_phrases)
+            line = f"Agents {names[0]} and {names[1]} {phrase}."
+        elif stype == "alliance":
+            phrase = random.choice(self.alliance_phrases)
+            line = f"Agents {', '.join(names)} {phrase}."
+        else:
+            line = f"Agents {', '.join(names)} interacted."
 
+        story.append(line)
+        return story
 
+    def epilogue(self):
+        if not self.started:
+            return ["The swarm moved in silence, with no notable interactions."]
+        return [
+            "\n🧠 Epilogue:\n"
+            "Though governed by simple rules, the swarm revealed complex relationships—a reminder that stories can emerge even from mathematics."
+        ]
 
 
+# ---------------------------
+# Story Stream
+# ---------------------------
+class StoryStreamWriter:
+    """
+    StoryMapper sink that writes the story as it happens: every event as
+    one JSON line of story_output.jsonl, and its narrative lines to
+    story.txt. Nothing is kept in memory but the narrator's state; files
+    are flushed once per frame and the epilogue is written on close.
+    """
+    def __init__(self, output_dir, narrator=None):
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.json_file = output_dir / "story_output.jsonl"
+        self.story_file = output_dir / "story.txt"
+        self.events = open(self.json_file, "w", encoding="utf-8")
+        self.text = open(self.story_file, "w", encoding="utf-8")
+        self.narrator = narrator or Narrator()
+
+    def write_event(self, event):
+        self.events.write(json.dumps(event) + "\n")
+        for line in self.narrator.feed(event):
+            self.text.write(line + "\n")
+
+    def flush(self):
+        self.events.flush()
+        self.text.flush()
+
+    def close(self):
+        if self.text.closed:
+            return
+        for line in self.narrator.epilogue():
+            self.text.write(line + "\n")
+        self.events.close()
+        self.text.close()